@@ -0,0 +1,178 @@
+"""Headless batch processing of many images with the lab's pipeline
+
+Example::
+
+    python batch_process.py photos/ --params params.json --output-dir out/
+
+params.json holds the same keys as the sidebar ``params`` dict; keys that are
+left out take the sidebar defaults. Every input is written as a PNG to the
+output directory and one row per image is appended to a statistics CSV with
+the ``Original_*``/``Processed_*`` columns of the "Download Statistics"
+export. Rows are appended as soon as an image finishes, so an interrupted
+run continues where it stopped when started again with ``--resume``.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+from PIL import Image
+
+import settings
+from buffer_pool import BufferPool
+from image_decode import decode_image
+from image_processing import DEFAULT_PARAMS, apply_image_processing, output_shape
+from image_stats import calculate_image_stats
+from tiled_processing import apply_image_processing_tiled, memmap_output
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+STAT_KEYS = ('Width', 'Height', 'Channels', 'Mean Brightness', 'Std Brightness',
+             'Min Intensity', 'Max Intensity', 'Total Pixels')
+CSV_COLUMNS = (['File']
+               + [f"Original_{k}" for k in STAT_KEYS]
+               + [f"Processed_{k}" for k in STAT_KEYS])
+
+
+def load_params(path):
+    """Read a params JSON file, filling missing keys with the sidebar defaults"""
+    params = dict(DEFAULT_PARAMS)
+    if path is None:
+        return params
+    with open(path) as f:
+        overrides = json.load(f)
+    unknown = set(overrides) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown parameters in {path}: {', '.join(sorted(unknown))}")
+    params.update(overrides)
+    return params
+
+
+def find_images(inputs):
+    """Expand directories and glob patterns into a sorted list of image files"""
+    found = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        found.update(path for path in candidates
+                     if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(found)
+
+
+def output_name(path):
+    return os.path.splitext(os.path.basename(path))[0] + '.png'
+
+
+# Stage buffers of this worker process; images of one batch are often the
+# same size, so after the first file the pipeline stops allocating. Mixed
+# sizes would each leave their buffers behind, hence the byte limit
+_pool = BufferPool(settings.BATCH_POOL_BYTES)
+
+
+def _init_worker():
+    # The pool already occupies every core; keep OpenCV from adding threads
+    cv2.setNumThreads(1)
+
+
+def process_file(path, params, output_dir):
+    """Process one image file and return its statistics row"""
+    image = decode_image(path)
+    tiled = image.shape[0] * image.shape[1] >= settings.TILED_MIN_PIXELS
+    if tiled:
+        # Large outputs go to a memory-mapped file rather than process memory
+        processed = apply_image_processing_tiled(
+            image, params, out=memmap_output(output_shape(image.shape, params)))
+    else:
+        processed = apply_image_processing(image, params, _pool)
+    Image.fromarray(processed).save(os.path.join(output_dir, output_name(path)))
+    
+    original_stats = calculate_image_stats(image).as_dict()
+    processed_stats = calculate_image_stats(processed).as_dict()
+    if not tiled:
+        _pool.release(processed)
+    return {'File': os.path.basename(path),
+            **{f"Original_{k}": v for k, v in original_stats.items()},
+            **{f"Processed_{k}": v for k, v in processed_stats.items()}}
+
+
+def completed_rows(stats_csv, output_dir):
+    """CSV rows of an earlier run whose output image still exists"""
+    if not os.path.exists(stats_csv):
+        return []
+    with open(stats_csv, newline='') as f:
+        return [row for row in csv.DictReader(f)
+                if os.path.exists(os.path.join(output_dir, output_name(row['File'])))]
+
+
+def run_batch(paths, params, output_dir, stats_csv, workers, resume=False):
+    """Process paths on a process pool; returns (processed, failed, seconds)"""
+    os.makedirs(output_dir, exist_ok=True)
+    done = completed_rows(stats_csv, output_dir) if resume else []
+    if done:
+        finished = {row['File'] for row in done}
+        paths = [path for path in paths if os.path.basename(path) not in finished]
+        print(f"Resuming: skipping {len(finished)} already processed images")
+    
+    started = time.perf_counter()
+    count = 0
+    failed = 0
+    # Rewrite the CSV so rows of images that have to be redone are not duplicated
+    with open(stats_csv, 'w', newline='') as f, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(done)
+        f.flush()
+        futures = {pool.submit(process_file, path, params, output_dir): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as exc:
+                print(f"Failed: {futures[future]}: {exc}", file=sys.stderr)
+                failed += 1
+                continue
+            writer.writerow(row)
+            f.flush()
+            count += 1
+            if count % 50 == 0 or count == len(paths):
+                elapsed = time.perf_counter() - started
+                print(f"{count}/{len(paths)} images, {count / elapsed:.2f} images/s")
+    return count, failed, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-process images with the lab's pipeline")
+    parser.add_argument('inputs', nargs='+', help="Input directories or glob patterns")
+    parser.add_argument('--params', help="JSON file with sidebar parameters")
+    parser.add_argument('--output-dir', required=True, help="Directory for processed PNGs")
+    parser.add_argument('--stats-csv', help="Statistics CSV (default: <output-dir>/image_statistics.csv)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip images already recorded in the statistics CSV")
+    args = parser.parse_args(argv)
+    
+    params = load_params(args.params)
+    paths = find_images(args.inputs)
+    if not paths:
+        parser.error("no PNG or JPEG images found")
+    names = [output_name(path) for path in paths]
+    if len(set(names)) != len(names):
+        parser.error("several inputs would be written to the same output file name")
+    
+    stats_csv = args.stats_csv or os.path.join(args.output_dir, 'image_statistics.csv')
+    count, failed, elapsed = run_batch(paths, params, args.output_dir, stats_csv,
+                                       args.workers, args.resume)
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {count} images in {elapsed:.1f}s ({rate:.2f} images/s)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
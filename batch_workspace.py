@@ -0,0 +1,75 @@
+"""Concurrent processing of the images of the Batch Compare workspace
+
+Every image of the workspace is processed with the same params on a
+process-wide thread pool. The result of one image (its thumbnails and the
+statistics of the original and the processed image) is kept in the shared
+result cache under the pipeline key, so it is computed once and reused on
+every rerun until the image or the params change; moving one slider only
+reprocesses from the stage that changed, as on the main page.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+from image_processing import make_preview, pipeline_key, process_image_cached
+from image_stats import calculate_image_stats_cached
+from perf import measure
+from result_cache import shared_cache
+from tiled_processing import limit_cv2_threads, render_full_resolution
+
+# Longest side of the thumbnails in the grid
+THUMBNAIL_SIDE = 320
+
+_executor = ThreadPoolExecutor(max_workers=settings.BATCH_WORKERS, thread_name_prefix='batch')
+
+
+class BatchResult(namedtuple('BatchResult', ['original_thumbnail', 'processed_thumbnail',
+                                               'original_stats', 'processed_stats'])):
+    """Thumbnails and exact statistics of one processed image
+
+    A tuple, so that the result cache counts and freezes the thumbnails.
+    """
+    __slots__ = ()
+
+    def statistics_row(self, name):
+        """Row of the combined table, in the columns of the statistics CSV export"""
+        return {'File': name,
+                **{f"Original_{k}": v for k, v in self.original_stats.as_dict().items()},
+                **{f"Processed_{k}": v for k, v in self.processed_stats.as_dict().items()}}
+
+
+def _render(image, params):
+    # Images already run side by side, so only the bounded memory of the
+    # tiled path is worth having; smaller ones take the staged, cached pipeline
+    if image.shape[0] * image.shape[1] >= settings.TILED_MIN_PIXELS:
+        return render_full_resolution(image, params)
+    return process_image_cached(image, params)
+
+
+def process_one(image, params):
+    """BatchResult of image processed with params, from the cache when possible"""
+    def compute():
+        processed = _render(image, params)
+        return BatchResult(make_preview(image, THUMBNAIL_SIDE),
+                           make_preview(processed, THUMBNAIL_SIDE),
+                           calculate_image_stats_cached(image, approximate=False),
+                           calculate_image_stats_cached(processed, approximate=False))
+
+    key = ('batch', pipeline_key(image, params), THUMBNAIL_SIDE)
+    return shared_cache.get_or_compute(key, compute)
+
+
+def process_batch(images, params):
+    """Process images concurrently; return a (BatchResult, error) pair per image
+
+    error is None on success, and the exception raised for that image otherwise.
+    """
+    if not images:
+        return []
+    with measure('batch', 'batch'), limit_cv2_threads(min(len(images), settings.BATCH_WORKERS)):
+        futures = [_executor.submit(process_one, image, params) for image in images]
+        outcomes = []
+        for future in futures:
+            error = future.exception()
+            outcomes.append((None, error) if error is not None else (future.result(), None))
+    return outcomes
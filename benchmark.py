@@ -0,0 +1,180 @@
+"""Benchmark suite timing every pipeline branch across image sizes
+
+Example::
+
+    python benchmark.py --output results.json
+    python benchmark.py --output new.json --compare results.json --threshold 0.15
+
+Inputs are drawn by the sample generators directly at each target size
+(0.25, 1, 12 and 50 megapixels by default). Each case is run once to warm up
+and then ``--repeat`` times; the median and minimum wall times are written
+to JSON. With ``--compare`` the run is checked against an earlier result and
+the script exits with status 1 when any case's median got slower by more than
+the threshold fraction.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import settings
+from image_processing import DEFAULT_PARAMS, PIPELINE_STAGES
+from image_stats import ImageStatistics, calculate_image_stats, gray_histogram
+from samples import NATIVE_SIZES, generate_sample
+
+DEFAULT_SIZES = (0.25, 1, 12, 50)
+MORPHOLOGY_TYPES = ('Erosion', 'Dilation', 'Opening', 'Closing')
+KERNEL_SIZES = tuple(range(3, 16, 2)) + (31, 51, 101, 127, 151, 201)
+SHAPE_KERNEL_SIZES = (5, 51, 201)
+
+
+def make_input(sample, megapixels):
+    """Generate a sample image of roughly the given number of megapixels"""
+    width, height = NATIVE_SIZES[sample]
+    scale = math.sqrt(megapixels * 1e6 / (width * height))
+    return generate_sample(sample, (max(1, round(width * scale)), max(1, round(height * scale))))
+
+
+def _stage(name):
+    return next(stage for stage in PIPELINE_STAGES if stage.name == name)
+
+
+def _stage_case(name, **overrides):
+    stage = _stage(name)
+    params = {**DEFAULT_PARAMS, **overrides}
+    return lambda image: stage.run(image, params)
+
+
+def benchmark_cases():
+    """Return (case name, function of the input image) pairs"""
+    cases = [('grayscale', _stage_case('grayscale', grayscale=True))]
+    cases += [(f'blur_{level}', _stage_case('blur', blur=level)) for level in range(1, 11)]
+    cases += [
+        ('brightness', _stage_case('tone', brightness=40)),
+        ('contrast', _stage_case('tone', contrast=1.5)),
+        ('brightness_contrast', _stage_case('tone', brightness=40, contrast=1.5)),
+        ('canny', _stage_case('edges', edge_detection=True)),
+    ]
+    for operation in MORPHOLOGY_TYPES:
+        for kernel_size in KERNEL_SIZES:
+            cases.append((f'{operation.lower()}_k{kernel_size}',
+                          _stage_case('morphology', morphology=operation, kernel_size=kernel_size)))
+    for kernel_size in SHAPE_KERNEL_SIZES:
+        for shape in ('Ellipse', 'Cross'):
+            cases.append((f'erosion_{shape.lower()}_k{kernel_size}',
+                          _stage_case('morphology', morphology='Erosion', kernel_size=kernel_size,
+                                      kernel_shape=shape)))
+        cases.append((f'erosion_k{kernel_size}_per_channel',
+                      _stage_case('morphology', morphology='Erosion', kernel_size=kernel_size,
+                                  morphology_per_channel=True)))
+    
+    def histogram(image):
+        return gray_histogram(cv2.cvtColor(image, cv2.COLOR_RGB2GRAY))
+    
+    def intensity_ranges(image):
+        return ImageStatistics(image.shape[1], image.shape[0], 3, histogram(image)).range_counts()
+    
+    def png_export(image):
+        buf = BytesIO()
+        Image.fromarray(image).save(buf, format='PNG')
+        return buf.getvalue()
+    
+    cases += [
+        ('image_stats', calculate_image_stats),
+        ('image_stats_sampled',
+         lambda image: calculate_image_stats(image, settings.APPROX_STATS_SAMPLE_PIXELS)),
+        ('histogram', histogram),
+        ('intensity_ranges', intensity_ranges),
+        ('png_export', png_export),
+    ]
+    return cases
+
+
+def time_case(function, image, repeat):
+    """Median and minimum wall time of function(image) after one warm-up run"""
+    function(image)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(image)
+        timings.append(time.perf_counter() - started)
+    return {'median': statistics.median(timings), 'min': min(timings), 'runs': repeat}
+
+
+def run_benchmarks(sizes, sample, repeat, selected=None):
+    results = {}
+    for megapixels in sizes:
+        image = make_input(sample, megapixels)
+        for name, function in benchmark_cases():
+            if selected and not any(part in name for part in selected):
+                continue
+            case = f'{megapixels:g}MP/{name}'
+            results[case] = time_case(function, image, repeat)
+            print(f"{case:<32} {results[case]['median'] * 1000:10.2f} ms")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the cases slower than baseline by more than threshold; return them"""
+    regressions = []
+    for case, timing in results.items():
+        if case not in baseline:
+            continue
+        ratio = timing['median'] / baseline[case]['median']
+        if ratio > 1 + threshold:
+            regressions.append(case)
+            print(f"REGRESSION {case}: {baseline[case]['median'] * 1000:.2f} ms -> "
+                  f"{timing['median'] * 1000:.2f} ms ({ratio:.2f}x)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image processing pipeline")
+    parser.add_argument('--sizes', type=float, nargs='+', default=DEFAULT_SIZES,
+                        help="Input sizes in megapixels")
+    parser.add_argument('--sample', default='Portrait Style', help="Sample image used as input")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case")
+    parser.add_argument('--cases', nargs='+', help="Only run cases whose name contains one of these")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Baseline JSON file from an earlier run")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Allowed slowdown fraction before a case counts as a regression")
+    args = parser.parse_args(argv)
+    
+    results = run_benchmarks(args.sizes, args.sample, args.repeat, args.cases)
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sample': args.sample,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Reusable arrays for the outputs and scratch images of pipeline stages
+
+Every OpenCV call that allocates its result touches fresh pages of a
+full-size array. Stages instead take their outputs from a ``BufferPool`` and
+pass them to cv2 as ``dst=``; once a stage has consumed its input, the input
+goes back to the pool and becomes the output of a later stage, so a pipeline
+ping-pongs between two buffers per shape. After the first frame of a given
+size, further frames allocate nothing.
+
+A pool that sees many sizes (a batch of mixed images) can be given a byte
+limit on its free buffers; beyond it, those of the least recently used
+shapes are dropped.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class BufferPool:
+    """Thread-safe free lists of arrays keyed by shape and dtype"""
+
+    def __init__(self, max_free_bytes=None):
+        self.max_free_bytes = max_free_bytes
+        self._free = OrderedDict()
+        self._free_bytes = 0
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.reuses = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        """Return an uninitialised array of the given shape and dtype"""
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                self.reuses += 1
+                self._free.move_to_end(key)
+                array = free.pop()
+                self._free_bytes -= array.nbytes
+                return array
+            self.allocations += 1
+        array = np.empty(shape, dtype)
+        with self._lock:
+            self.allocated_bytes += array.nbytes
+        return array
+
+    def release(self, *arrays):
+        """Hand arrays obtained from acquire back for reuse"""
+        with self._lock:
+            for array in arrays:
+                if array is None:
+                    continue
+                key = (array.shape, array.dtype.str)
+                free = self._free.setdefault(key, [])
+                self._free.move_to_end(key)
+                # Releasing twice would hand one buffer to two owners
+                if not any(other is array for other in free):
+                    free.append(array)
+                    self._free_bytes += array.nbytes
+            self._trim()
+
+    def _trim(self):
+        """Drop free buffers of the least recently used shapes beyond max_free_bytes"""
+        if self.max_free_bytes is None:
+            return
+        while self._free_bytes > self.max_free_bytes:
+            key, free = next(iter(self._free.items()))
+            if not free:
+                del self._free[key]
+                continue
+            self._free_bytes -= free.pop(0).nbytes
+
+    def clear(self):
+        """Drop the free buffers; buffers still held by callers are unaffected"""
+        with self._lock:
+            self._free.clear()
+            self._free_bytes = 0
+
+    def stats(self):
+        """Return allocation counters and the memory held by free buffers"""
+        with self._lock:
+            return {
+                'Allocations': self.allocations,
+                'Reuses': self.reuses,
+                'Allocated Bytes': self.allocated_bytes,
+                'Free Buffers': sum(len(free) for free in self._free.values()),
+                'Free Bytes': self._free_bytes,
+            }
+
+
+def acquire(pool, shape, dtype=np.uint8):
+    """Buffer from pool, or None so that cv2 allocates the result itself"""
+    return None if pool is None else pool.acquire(shape, dtype)
+
+
+def release(pool, *arrays):
+    if pool is not None:
+        pool.release(*arrays)
@@ -0,0 +1,123 @@
+"""Plotly figures of the Image Analysis & Visualization section
+
+Every figure depends only on ``ImageStatistics``, so it is kept in the shared
+result cache under the keys of the statistics it shows: the charts of the
+original image are built once per image, and moving a slider only rebuilds
+the charts of the processed image. An unchanged figure also serialises to the
+same message, which Streamlit's message cache then does not send again.
+
+The histogram traces place their points with ``x0``/``dx`` instead of an
+explicit list of 256 x values and carry the counts as an integer array,
+which keeps the figure JSON small. Charts of sampled statistics show counts
+estimated for the whole image and say so in their title.
+
+Plotly and pandas take a large share of a cold start, so they are imported
+inside the builders: a worker only loads them once a chart is first shown.
+"""
+from image_stats import INTENSITY_RANGES
+from result_cache import shared_cache
+
+
+ORIGINAL_COLOR = '#667eea'
+PROCESSED_COLOR = '#764ba2'
+
+# Pie colors of the Intensity Distribution charts
+DISTRIBUTION_COLORS = {
+    'Original': ['#1f4e79', '#2e6ba8', '#4a90d9', '#87ceeb'],
+    'Processed': ['#7b2d26', '#a73c2a', '#d64933', '#ff6b47'],
+}
+
+
+def _cached(name, stats, build):
+    """Build a figure once per combination of the statistics it shows"""
+    key = ('chart', name) + tuple(s.key for s in stats)
+    return shared_cache.get_or_compute(key, build)
+
+
+def _title(title, *stats):
+    """Chart title, marked when any of the statistics are sampled estimates"""
+    if any(s.approximate for s in stats):
+        return f'{title} (approximate)'
+    return title
+
+
+def histogram_figure(original, processed):
+    """Gray-level histograms of the original and processed image"""
+    def build():
+        import plotly.graph_objects as go
+
+        fig = go.Figure()
+        for name, stats, color in (('Original', original, ORIGINAL_COLOR),
+                                   ('Processed', processed, PROCESSED_COLOR)):
+            fig.add_trace(go.Scatter(
+                x0=0,
+                dx=1,
+                y=stats.counts,
+                mode='lines',
+                name=name,
+                line=dict(color=color, width=3),
+                fill='tonexty'
+            ))
+
+        fig.update_layout(
+            title=_title('Pixel Intensity Histogram Comparison', original, processed),
+            xaxis_title='Pixel Intensity (0-255)',
+            yaxis_title='Frequency',
+            hovermode='x unified',
+            height=500,
+            showlegend=True
+        )
+        return fig
+
+    return _cached('histogram', (original, processed), build)
+
+
+def statistics_figure(original, processed):
+    """Mean, standard deviation and extremes of both images side by side"""
+    def build():
+        import pandas as pd
+        import plotly.express as px
+
+        brightness_df = pd.DataFrame({
+            'Metric': ['Mean', 'Standard Deviation', 'Minimum', 'Maximum'],
+            'Original': [original.mean, original.std, original.min, original.max],
+            'Processed': [processed.mean, processed.std, processed.min, processed.max],
+        })
+        fig = px.bar(brightness_df, x='Metric', y=['Original', 'Processed'],
+                     title=_title('Intensity Statistics Comparison', original, processed),
+                     barmode='group',
+                     color_discrete_sequence=[ORIGINAL_COLOR, PROCESSED_COLOR])
+        fig.update_layout(height=400)
+        return fig
+
+    return _cached('statistics', (original, processed), build)
+
+
+def properties_figure(original):
+    """Width, height and pixel count of the original image"""
+    def build():
+        import plotly.express as px
+
+        fig = px.pie(values=[original.width, original.height, original.total_pixels],
+                     names=['Width', 'Height', 'Total Pixels'],
+                     title='Image Properties',
+                     color_discrete_sequence=px.colors.sequential.Blues_r)
+        fig.update_layout(height=400)
+        return fig
+
+    return _cached('properties', (original,), build)
+
+
+def distribution_figure(stats, which):
+    """Share of pixels in each intensity range; which is 'Original' or 'Processed'"""
+    def build():
+        import plotly.express as px
+
+        fig = px.pie(values=stats.range_counts(),
+                     names=[label for label, _, _ in INTENSITY_RANGES],
+                     title=_title(f'{which} Image Intensity Distribution', stats),
+                     color_discrete_sequence=DISTRIBUTION_COLORS[which])
+        fig.update_layout(height=400)
+        return fig
+
+    return _cached(f'distribution:{which}', (stats,), build)
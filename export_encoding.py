@@ -0,0 +1,121 @@
+"""Background rendering and encoding of full-resolution exports
+
+Encoding a large frame takes seconds, so exports run on a small process-wide
+thread pool instead of inside the Streamlit rerun. Finished files are kept in
+the shared result cache under the pipeline output key, the format and the
+encoder options, so asking for the same export again costs nothing.
+
+The worker threads have no session of their own, so each job records its
+spans (``render:full``, ``export:<format>``) on a recorder of its own and
+returns them with the file; the session that collects the result adds them
+to its Performance panel.
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+import settings
+from image_processing import pipeline_key
+from perf import PerfRecorder, activate, measure
+from result_cache import shared_cache
+from tiled_processing import render_full_resolution
+
+
+# Format label: (Pillow format, file extension, MIME type)
+EXPORT_FORMATS = {
+    'PNG': ('PNG', 'png', 'image/png'),
+    'JPEG': ('JPEG', 'jpg', 'image/jpeg'),
+    'WebP': ('WEBP', 'webp', 'image/webp'),
+}
+
+# Slider defaults: Pillow's own zlib level for PNG, and a lossy quality
+# high enough for analysis work
+DEFAULT_PNG_COMPRESSION = 6
+DEFAULT_QUALITY = 90
+
+_executor = ThreadPoolExecutor(max_workers=settings.EXPORT_WORKERS,
+                               thread_name_prefix='export')
+_pending = {}
+_lock = threading.Lock()
+
+
+def encoder_options(fmt, quality, lossless=False):
+    """Keyword arguments for Image.save; quality is the PNG compression level for PNG"""
+    if fmt == 'PNG':
+        return {'compress_level': int(quality)}
+    if fmt == 'JPEG':
+        return {'quality': int(quality)}
+    if fmt == 'WebP':
+        if lossless:
+            return {'lossless': True, 'quality': 100, 'method': 4}
+        return {'quality': int(quality)}
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def encode_image(image, fmt, quality, lossless=False):
+    """Encode an RGB or gray uint8 array into the bytes of an image file"""
+    pil_format = EXPORT_FORMATS[fmt][0]
+    buf = BytesIO()
+    with measure(f'export:{fmt.lower()}', 'export'):
+        Image.fromarray(image.astype('uint8', copy=False)).save(
+            buf, format=pil_format, **encoder_options(fmt, quality, lossless))
+    return buf.getvalue()
+
+
+def export_key(image, params, fmt, quality, lossless=False):
+    """Cache key of an export of the full-resolution result of image and params"""
+    # Lossless WebP ignores quality, so every quality maps to one file
+    if fmt == 'WebP' and lossless:
+        quality = None
+    return ('export', pipeline_key(image, params), fmt, quality, bool(lossless))
+
+
+def _render_and_encode(key, image, params, fmt, quality, lossless):
+    job = PerfRecorder(capacity=256)
+    activate(job)
+    try:
+        with measure('export', 'export'):
+            data = encode_image(render_full_resolution(image, params), fmt, quality, lossless)
+    finally:
+        activate(None)
+    shared_cache.put(key, data)
+    return data, list(job.records)
+
+
+def _finished(key, future):
+    with _lock:
+        if _pending.get(key) is future:
+            del _pending[key]
+
+
+def request_export(image, params, fmt, quality, lossless=False):
+    """Return (key, future) for an export, starting it in the background if needed
+
+    The future resolves to (file bytes, perf records of rendering and
+    encoding), the records being empty when the file came from the cache.
+    Concurrent requests for the same export share one job.
+    """
+    key = export_key(image, params, fmt, quality, lossless)
+    cached = shared_cache.get(key)
+    if cached is not None:
+        future = Future()
+        future.set_result((cached, []))
+        return key, future
+
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _executor.submit(_render_and_encode, key, image, params,
+                                      fmt, quality, lossless)
+            _pending[key] = future
+    # Outside the lock: the callback runs at once if the job already finished
+    future.add_done_callback(lambda f: _finished(key, f))
+    return key, future
+
+
+def export_file_name(fmt, stem='processed_image'):
+    """File name and MIME type of an export in the given format"""
+    _, extension, mime = EXPORT_FORMATS[fmt]
+    return f"{stem}.{extension}", mime
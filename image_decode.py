@@ -0,0 +1,79 @@
+"""Decode-once image loading for uploads, camera captures and batch inputs
+
+Uploads are decoded once per distinct file content and kept in the shared
+result cache until the image store takes them over; callers compare
+``upload_digest`` with the file they loaded last so that reruns caused by
+slider moves never decode again. Every
+image is normalized to 8-bit RGB at decode time (RGBA, palette, grayscale and
+16-bit inputs included), which spares the pipeline from handling other
+layouts. JPEGs larger than the preview additionally get a reduced decode
+produced with DCT scaling, which is all the interactive preview needs.
+"""
+import hashlib
+import math
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+import settings
+from perf import measure
+from result_cache import shared_cache
+
+
+# Modes of 16-bit grayscale images; 'I' is what PIL reports for some PNGs
+_WIDE_GRAY_MODES = ('I', 'I;16', 'I;16L', 'I;16B')
+
+
+def _to_rgb(pil_image):
+    if pil_image.mode in _WIDE_GRAY_MODES:
+        # PIL's own conversion clips at 255; keep the high byte instead
+        gray = np.minimum(np.asarray(pil_image).astype(np.uint32) >> 8, 255).astype(np.uint8)
+        return np.repeat(gray[:, :, None], 3, axis=2)
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    return np.array(pil_image)
+
+
+def decode_image(source):
+    """Decode a file path or file-like object to an RGB array"""
+    with Image.open(source) as pil_image:
+        return _to_rgb(pil_image)
+
+
+def decode_reduced(data, max_side):
+    """Decode JPEG bytes at the smallest DCT scale still covering max_side
+
+    Returns None for other formats and for images that already fit.
+    """
+    with Image.open(BytesIO(data)) as pil_image:
+        width, height = pil_image.size
+        scale = max_side / max(width, height)
+        if pil_image.format != 'JPEG' or scale >= 1.0:
+            return None
+        pil_image.draft('RGB', (math.ceil(width * scale), math.ceil(height * scale)))
+        return _to_rgb(pil_image)
+
+
+def upload_digest(uploaded_file):
+    """Hash of the content of an uploaded file"""
+    return hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
+
+
+def load_upload(uploaded_file, preview_side=None):
+    """Return (full, reduced) arrays for an uploaded file, decoding it once
+
+    Results are cached by a hash of the file content; reduced is None when no
+    reduced decode is available.
+    """
+    if preview_side is None:
+        preview_side = settings.PREVIEW_MAX_SIDE
+    data = uploaded_file.getbuffer()
+    key = ('decoded', upload_digest(uploaded_file), preview_side)
+    
+    def compute():
+        raw = bytes(data)
+        with measure('decode', 'decode'):
+            return decode_image(BytesIO(raw)), decode_reduced(raw, preview_side)
+    
+    return shared_cache.get_or_compute(key, compute)
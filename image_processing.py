@@ -0,0 +1,339 @@
+"""Image processing pipeline used by the Streamlit app
+
+The pipeline is an ordered list of stages. Each stage only reads the
+parameters it names in ``keys``, which lets ``process_image_cached`` key every
+intermediate result by the parameters of that stage and all stages before it
+and resume from the first stage whose parameters changed.
+
+``execution_plan`` turns the parameters into the stages that actually run.
+Grayscale, edge detection and grayscale morphology leave a single-channel
+image, and the following stages keep working on that one channel: on an
+image whose three channels are equal, every stage gives three equal
+channels, and RGB2GRAY of such a pixel is the pixel itself. The gray image
+is therefore expanded to RGB once, at the end, instead of after every stage
+that used to convert back and forth. Stages that cannot change the image
+are dropped from the plan.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from buffer_pool import acquire, release
+from morphology import morphology
+from perf import measure
+from result_cache import freeze, image_key, shared_cache
+
+
+# Parameters produced by the sidebar controls when nothing has been changed
+DEFAULT_PARAMS = {
+    'grayscale': False,
+    'blur': 0,
+    'brightness': 0,
+    'contrast': 1.0,
+    'edge_detection': False,
+    'canny_low': 50,
+    'canny_high': 150,
+    'morphology': 'None',
+    'kernel_size': 5,
+    'kernel_shape': 'Square',
+    'morphology_per_channel': False,
+}
+
+
+# name: label used in cache keys, keys: params read by the stage,
+# enabled: params -> bool, run: (image, params, pool=None) -> new image, taken
+# from pool when one is given and never written over the input,
+# radius: params -> rows of context an output pixel depends on, or None when
+# the stage is not local (Canny hysteresis can follow an edge arbitrarily far)
+Stage = namedtuple('Stage', ['name', 'keys', 'enabled', 'run', 'radius'])
+
+
+def _grayscale(image, params, pool=None):
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY, dst=acquire(pool, image.shape[:2]))
+
+
+def _to_rgb(image, params, pool=None):
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB, dst=acquire(pool, image.shape + (3,)))
+
+
+def _blur(image, params, pool=None):
+    ksize = int(params['blur']) * 2 + 1
+    return cv2.GaussianBlur(image, (ksize, ksize), 0, dst=acquire(pool, image.shape))
+
+
+@lru_cache(maxsize=64)
+def tone_lut(brightness, contrast):
+    """Build one 256-entry LUT equal to the brightness pass followed by contrast
+
+    The LUT is produced by running the exact ``convertScaleAbs`` calls of the
+    per-pixel adjustments over the ramp 0..255, so rounding, absolute value and
+    saturation happen in the same order as on the full frame.
+    """
+    lut = np.arange(256, dtype=np.uint8).reshape(1, 256)
+    if brightness != 0:
+        lut = cv2.convertScaleAbs(lut, beta=brightness)
+    if contrast != 1.0:
+        lut = cv2.convertScaleAbs(lut, alpha=contrast)
+    lut.flags.writeable = False
+    return lut
+
+
+def _tone(image, params, pool=None):
+    return cv2.LUT(image, tone_lut(params['brightness'], params['contrast']),
+                   dst=acquire(pool, image.shape))
+
+
+def _to_gray(image, pool):
+    """Gray view of image; returns (gray, scratch buffer to release or None)"""
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY, dst=acquire(pool, image.shape[:2]))
+        return gray, gray
+    return image, None
+
+
+def _edges(image, params, pool=None):
+    gray, scratch = _to_gray(image, pool)
+    edges = cv2.Canny(gray, params['canny_low'], params['canny_high'],
+                      edges=acquire(pool, gray.shape))
+    release(pool, scratch)
+    return edges
+
+
+def _morphology(image, params, pool=None):
+    args = (params['morphology'], params['kernel_size'], params['kernel_shape'])
+    if params['morphology_per_channel'] and len(image.shape) == 3:
+        return morphology(image, *args, dst=acquire(pool, image.shape))
+    
+    gray, scratch = _to_gray(image, pool)
+    result = morphology(gray, *args, dst=acquire(pool, gray.shape))
+    release(pool, scratch)
+    return result
+
+
+def _morphology_radius(params):
+    radius = params['kernel_size'] // 2
+    # Opening and closing apply the kernel twice
+    if params['morphology'] in ('Opening', 'Closing'):
+        radius *= 2
+    return radius
+
+
+# Stages in the order the sidebar applies them. Grayscale, edges and
+# grayscale morphology return a single channel; see execution_plan
+PIPELINE_STAGES = (
+    Stage('grayscale', ('grayscale',), lambda p: p['grayscale'], _grayscale, lambda p: 0),
+    Stage('blur', ('blur',), lambda p: p['blur'] > 0, _blur, lambda p: int(p['blur'])),
+    Stage('tone', ('brightness', 'contrast'),
+          lambda p: p['brightness'] != 0 or p['contrast'] != 1.0, _tone, lambda p: 0),
+    Stage('edges', ('canny_low', 'canny_high'), lambda p: p['edge_detection'], _edges,
+          lambda p: None),
+    Stage('morphology', ('morphology', 'kernel_size', 'kernel_shape', 'morphology_per_channel'),
+          lambda p: p['morphology'] != 'None',
+          _morphology, _morphology_radius),
+)
+
+# Conversions the plan inserts: to gray where a stage reduces to just that,
+# and the final expansion of a single-channel result to RGB
+TO_GRAY = Stage('gray', (), lambda p: True, _grayscale, lambda p: 0)
+TO_RGB = Stage('rgb', (), lambda p: True, _to_rgb, lambda p: 0)
+_IDENTITY_LUT = np.arange(256, dtype=np.uint8).reshape(1, 256)
+
+
+def _stage_ndim(stage, params, ndim):
+    """Dimensions of the array a stage returns for an input with ndim dimensions"""
+    if stage.name == 'rgb':
+        return 3
+    if stage.name in ('grayscale', 'gray', 'edges'):
+        return 2
+    if stage.name == 'morphology' and not (params['morphology_per_channel'] and ndim == 3):
+        return 2
+    return ndim
+
+
+def _is_identity(stage, params, ndim):
+    """True when stage leaves an input with ndim dimensions unchanged"""
+    if stage.name == 'grayscale':
+        return ndim == 2
+    if stage.name == 'tone':
+        return np.array_equal(tone_lut(params['brightness'], params['contrast']), _IDENTITY_LUT)
+    if stage.name == 'morphology':
+        return params['kernel_size'] <= 1 and _stage_ndim(stage, params, ndim) == ndim
+    return False
+
+
+def execution_plan(params, ndim=3):
+    """Return the stages that reproduce the pipeline on an image with ndim dimensions
+
+    The plan runs single-channel from the first stage that produces gray and
+    ends with one expansion to RGB where the pipeline returns color. Stages
+    that leave the image unchanged are dropped; the output is identical to
+    running every enabled stage with its conversions.
+    """
+    plan = []
+    current = ndim
+    # Edges and morphology return RGB even for a gray input
+    color_output = ndim == 3
+    for stage in PIPELINE_STAGES:
+        if not stage.enabled(params):
+            continue
+        if stage.name in ('edges', 'morphology'):
+            color_output = True
+        if _is_identity(stage, params, current):
+            continue
+        if stage.name == 'morphology' and params['kernel_size'] <= 1:
+            # Nothing is left of a one-pixel filter but the conversion to gray
+            stage = TO_GRAY
+        plan.append(stage)
+        current = _stage_ndim(stage, params, current)
+    if current == 2 and color_output:
+        plan.append(TO_RGB)
+    return plan
+
+
+def _stage_signature(stage, params):
+    """Hashable description of one enabled stage and its parameters"""
+    values = tuple(round(params[k], 6) if isinstance(params[k], float) else params[k]
+                   for k in stage.keys)
+    return (stage.name, values)
+
+
+def _stage_keys(image, stages, params):
+    """Cache key of every stage output, each covering all stages before it"""
+    keys = []
+    key = ('stage', image_key(image))
+    for stage in stages:
+        key = key + (_stage_signature(stage, params),)
+        keys.append(key)
+    return keys
+
+
+def pipeline_key(image, params):
+    """Cache key of the final pipeline output for image and params
+
+    Any execution strategy that reproduces apply_image_processing exactly may
+    store its result under this key.
+    """
+    keys = _stage_keys(image, execution_plan(params, image.ndim), params)
+    return keys[-1] if keys else ('stage', image_key(image))
+
+
+def output_shape(shape, params):
+    """Shape of the pipeline output for an input of the given shape"""
+    return stages_output_shape(shape, execution_plan(params, len(shape)), params)
+
+
+def stages_output_shape(shape, stages, params):
+    """Shape produced by running stages of a plan on an input of the given shape"""
+    ndim = len(shape)
+    for stage in stages:
+        ndim = _stage_ndim(stage, params, ndim)
+    if ndim == len(shape):
+        return tuple(shape)
+    return tuple(shape[:2]) + ((3,) if ndim == 3 else ())
+
+
+def apply_image_processing(image, params, pool=None):
+    """Apply image processing based on parameters
+
+    With a BufferPool, every stage writes into buffers taken from the pool and
+    hands its input back once it is consumed. The returned array then belongs
+    to the caller until it is released to the pool again; releasing it before
+    the next call lets a steady stream of same-sized frames run without any
+    allocation. The input image is never modified.
+    """
+    processed = image
+    for stage in execution_plan(params, image.ndim):
+        with measure(f'stage:{stage.name}'):
+            result = stage.run(processed, params, pool)
+        if processed is not image and result is not processed:
+            release(pool, processed)
+        processed = result
+    
+    # Never hand the caller's own array back
+    if processed is image:
+        if pool is None:
+            processed = image.copy()
+        else:
+            processed = pool.acquire(image.shape, image.dtype)
+            np.copyto(processed, image)
+    return processed
+
+
+def process_image_cached(image, params):
+    """Apply image processing, resuming from the first stage that changed
+
+    Every stage output is stored in the shared result cache under the image
+    hash and the parameters of that stage and all enabled stages before it, so
+    moving one slider only recomputes the stages from that point onward.
+    Disabled stages are the identity and do not take part in the key. The
+    returned array is shared between sessions and therefore read-only; with
+    no stage enabled it is the input image itself.
+    """
+    stages = execution_plan(params, image.ndim)
+    keys = _stage_keys(image, stages, params)
+    
+    # Resume after the longest prefix of the pipeline that is already cached
+    processed = image
+    start = 0
+    if keys:
+        last, cached = shared_cache.get_last(keys)
+        if cached is not None:
+            processed = cached
+            start = last + 1
+    
+    for stage, key in zip(stages[start:], keys[start:]):
+        with measure(f'stage:{stage.name}'):
+            processed = stage.run(processed, params)
+        if processed is not image:
+            shared_cache.put(key, freeze(processed))
+    return processed
+
+
+def preview_scale(image, max_side):
+    """Downscale factor that fits the longest image side into max_side"""
+    return min(1.0, max_side / max(image.shape[0], image.shape[1]))
+
+
+def make_preview(image, max_side, source=None):
+    """Return a cached, area-averaged proxy of image for interactive display
+
+    source may be a cheaper reduced-resolution version of image, such as a
+    reduced JPEG decode, at least as large as the proxy; it is then resized
+    instead of the full image.
+    """
+    scale = preview_scale(image, max_side)
+    if scale >= 1.0:
+        return image
+    
+    def compute():
+        size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+        base = source if source is not None and source.shape[1] >= size[0] else image
+        with measure('preview', 'render'):
+            return cv2.resize(base, size, interpolation=cv2.INTER_AREA)
+    
+    return shared_cache.get_or_compute(('preview', image_key(image), max_side), compute)
+
+
+def scale_params(params, scale):
+    """Adapt params so a proxy at the given scale looks like the full render
+
+    The Gaussian sigma that OpenCV derives from the blur kernel and the
+    morphology kernel are measured in pixels, so both shrink with the image.
+    Canny thresholds compare gradient magnitudes of intensities, which the
+    area-averaged proxy preserves, and are left unchanged.
+    """
+    if scale >= 1.0:
+        return params
+    scaled = dict(params)
+    
+    if params['blur'] > 0:
+        # OpenCV uses sigma = 0.3 * ((ksize - 1) / 2 - 1) + 0.8 = 0.3 * blur + 0.5
+        sigma = (0.3 * params['blur'] + 0.5) * scale
+        scaled['blur'] = max(0, round((sigma - 0.5) / 0.3))
+    
+    if params['morphology'] != 'None':
+        scaled['kernel_size'] = max(1, 2 * round((params['kernel_size'] * scale - 1) / 2) + 1)
+    
+    return scaled
@@ -0,0 +1,230 @@
+"""Image statistics used by the analysis tabs and the CSV export
+
+All figures are derived from a single 256-bin histogram of the gray image,
+so the mean, standard deviation, extremes, intensity ranges and the
+histogram chart cost one pass over the pixels instead of one pass each.
+
+From ``settings.APPROX_STATS_MIN_PIXELS`` on, the interactive views build
+that histogram from a stratified sample of about
+``settings.APPROX_STATS_SAMPLE_PIXELS`` pixels instead: one pixel at a random
+place in each cell of an even grid, which covers the whole frame without
+aliasing against regular patterns. Such statistics are marked
+``approximate`` and report 95% confidence intervals computed as for a simple
+random sample, which stratification only makes conservative. Batch, video
+and CSV exports always use the exact computation.
+
+While the app shows a reduced preview, the processed image only exists at
+preview size; ``preview_estimate`` reports the preview's statistics as an
+approximate estimate for the full-size image.
+"""
+import hashlib
+import math
+
+import cv2
+import numpy as np
+
+import settings
+from perf import measure
+from result_cache import image_key, shared_cache
+
+
+# Label, first and last+1 intensity of each bucket in the Intensity Distribution tab
+INTENSITY_RANGES = (
+    ('Very Dark (0-63)', 0, 64),
+    ('Dark (64-127)', 64, 128),
+    ('Bright (128-191)', 128, 192),
+    ('Very Bright (192-255)', 192, 256),
+)
+
+# Two-sided 95% quantile of the normal distribution
+CONFIDENCE = 0.95
+_Z = 1.959964
+
+# cv2.calcHist counts in float32, which is exact up to 2 ** 24 per bin
+_HIST_CHUNK_PIXELS = 1 << 22
+
+
+class ImageStatistics:
+    """Statistics of one image computed from its gray-level histogram"""
+
+    def __init__(self, width, height, channels, hist, sample_size=None):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.hist = hist
+        self.hist.flags.writeable = False
+        # Pixels the histogram was built from when it is a sample, else None
+        self.sample_size = sample_size
+        self._key = None
+        
+        levels = np.arange(256, dtype=np.float64)
+        total = hist.sum()
+        self.mean = float(levels @ hist / total)
+        self.std = float(np.sqrt(((levels - self.mean) ** 2) @ hist / total))
+        self._m4 = float(((levels - self.mean) ** 4) @ hist / total)
+        occupied = np.flatnonzero(hist)
+        self.min = int(occupied[0])
+        self.max = int(occupied[-1])
+
+        # Histogram scaled to the whole image
+        if sample_size is None:
+            self.counts = hist
+        else:
+            self.counts = np.rint(hist * (self.total_pixels / total)).astype(np.int64)
+            self.counts.flags.writeable = False
+
+    @property
+    def total_pixels(self):
+        return self.width * self.height
+
+    @property
+    def approximate(self):
+        return self.sample_size is not None
+
+    @property
+    def key(self):
+        """Content hash of the statistics, for caching what is derived from them"""
+        if self._key is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(str((self.width, self.height, self.channels, self.sample_size)).encode())
+            h.update(np.ascontiguousarray(self.hist, dtype=np.int64).tobytes())
+            self._key = h.hexdigest()
+        return self._key
+
+    def range_counts(self):
+        """Pixel counts for each entry of INTENSITY_RANGES (estimates when approximate)"""
+        return [int(self.counts[start:stop].sum()) for _, start, stop in INTENSITY_RANGES]
+
+    def intervals(self):
+        """CONFIDENCE intervals of the sampled figures, keyed like as_dict and
+        INTENSITY_RANGES; empty when the statistics are exact
+
+        The extremes of a sample only bound those of the image, so their
+        intervals reach to 0 and 255.
+        """
+        if not self.approximate:
+            return {}
+        n = self.sample_size
+        mean_error = _Z * self.std / math.sqrt(n)
+        # Delta method: the variance of the sample variance is (m4 - s^4) / n
+        std_error = 0.0
+        if self.std > 0:
+            std_error = _Z * math.sqrt(max(self._m4 - self.std ** 4, 0.0) / n) / (2 * self.std)
+        intervals = {
+            'Mean Brightness': (self.mean - mean_error, self.mean + mean_error),
+            'Std Brightness': (max(self.std - std_error, 0.0), self.std + std_error),
+            'Min Intensity': (0, self.min),
+            'Max Intensity': (self.max, 255),
+        }
+        for label, start, stop in INTENSITY_RANGES:
+            p = self.hist[start:stop].sum() / n
+            error = _Z * math.sqrt(p * (1 - p) / n)
+            intervals[label] = (max(p - error, 0.0) * self.total_pixels,
+                                min(p + error, 1.0) * self.total_pixels)
+        return intervals
+
+    def as_dict(self):
+        """Statistics in the layout shown in the tables and exported to CSV"""
+        return {
+            'Width': self.width,
+            'Height': self.height,
+            'Channels': self.channels,
+            'Mean Brightness': self.mean,
+            'Std Brightness': self.std,
+            'Min Intensity': self.min,
+            'Max Intensity': self.max,
+            'Total Pixels': self.total_pixels
+        }
+
+
+def _band_rows(image):
+    return max(1, _HIST_CHUNK_PIXELS // max(1, image.shape[1]))
+
+
+def gray_histogram(gray):
+    """Exact 256-bin histogram of a uint8 gray image"""
+    hist = np.zeros(256, np.int64)
+    rows = _band_rows(gray)
+    for top in range(0, gray.shape[0], rows):
+        band = cv2.calcHist([gray[top:top + rows]], [0], None, [256], [0, 256])
+        hist += band.ravel().astype(np.int64)
+    return hist
+
+
+def _image_histogram(image):
+    """Gray-level histogram of an RGB or gray image, converting one band at a time"""
+    if len(image.shape) == 2:
+        return gray_histogram(image)
+    hist = np.zeros(256, np.int64)
+    rows = _band_rows(image)
+    for top in range(0, image.shape[0], rows):
+        hist += gray_histogram(cv2.cvtColor(image[top:top + rows], cv2.COLOR_RGB2GRAY))
+    return hist
+
+
+def sample_pixels(image, sample_size, seed=0):
+    """About sample_size pixels of image, one at a random place in each cell of
+    an even grid, as a 2-D array of pixels
+
+    The fixed seed makes the sample, and so the estimates, the same each time.
+    """
+    height, width = image.shape[:2]
+    step = max(1, math.ceil(math.sqrt(height * width / sample_size)))
+    rows, cols = max(1, height // step), max(1, width // step)
+    rng = np.random.default_rng(seed)
+    ys = np.arange(rows)[:, None] * step + rng.integers(0, min(step, height), (rows, cols))
+    xs = np.arange(cols)[None, :] * step + rng.integers(0, min(step, width), (rows, cols))
+    return image[ys, xs]
+
+
+def calculate_image_stats(image, sample_size=None):
+    """Calculate various image statistics
+
+    With sample_size, and an image larger than that, the statistics are
+    estimated from about sample_size pixels.
+    """
+    with measure('stats', 'stats'):
+        sampled = None
+        if sample_size is not None and image.shape[0] * image.shape[1] > sample_size:
+            sample = sample_pixels(image, sample_size)
+            sampled = sample.shape[0] * sample.shape[1]
+            hist = _image_histogram(sample)
+        else:
+            hist = _image_histogram(image)
+        
+        return ImageStatistics(
+            width=image.shape[1],
+            height=image.shape[0],
+            channels=len(image.shape) if len(image.shape) == 2 else image.shape[2],
+            hist=hist,
+            sample_size=sampled,
+        )
+
+
+def calculate_image_stats_cached(image, approximate=None):
+    """Calculate image statistics, reusing the shared result cache
+
+    approximate=None samples images of at least APPROX_STATS_MIN_PIXELS
+    pixels; True or False forces the sampled or the exact computation.
+    """
+    if approximate is None:
+        approximate = image.shape[0] * image.shape[1] >= settings.APPROX_STATS_MIN_PIXELS
+    if not approximate:
+        key = ('stats', image_key(image))
+        return shared_cache.get_or_compute(key, lambda: calculate_image_stats(image))
+    sample_size = settings.APPROX_STATS_SAMPLE_PIXELS
+    key = ('stats', image_key(image), sample_size)
+    return shared_cache.get_or_compute(key, lambda: calculate_image_stats(image, sample_size))
+
+
+def preview_estimate(stats, width, height):
+    """Statistics of a width x height image estimated from those of its preview
+
+    The preview's pixels are treated as a sample of the full image, so the
+    result is approximate and has the full image's size. Area averaging makes
+    the preview a little smoother than the image, which narrows the spread.
+    """
+    if (stats.width, stats.height) == (width, height):
+        return stats
+    return ImageStatistics(width=width, height=height, channels=stats.channels, hist=stats.hist,
+                           sample_size=stats.sample_size or stats.total_pixels)
@@ -0,0 +1,246 @@
+"""Process-wide store of the images that sessions are working on
+
+Every session used to keep its own full-resolution array, so a hundred users
+opening the same sample held a hundred identical copies. Sessions now keep an
+``ImageHandle``; the array itself lives once in the store, keyed by its
+content hash and reference counted by the handles pointing at it. When the
+last handle is garbage collected (the user loads another image or the
+session ends) the image leaves the store.
+
+Resident images are bounded by a global byte ceiling: beyond it, the least
+recently used ones are written to spill files on disk and read back on their
+next use. Each session may hold at most a configurable number of bytes of
+images; a request over that cap raises ``ImageLimitError`` so the app can show
+a message instead of running the worker out of memory.
+
+A read-only image is adopted without a copy, and any result cache entry
+holding it (a decoded upload, a generated sample) is dropped at the same
+time, so the store is its only owner and spilling it really frees the memory.
+The store remembers those cache keys and answers for them as the cache's
+fallback while the image is stored, so loading the same sample or file again,
+from any session, returns the stored array instead of recomputing it.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+import settings
+from result_cache import freeze, image_key, shared_cache
+
+
+class ImageLimitError(Exception):
+    """Raised when a session would hold more image bytes than it is allowed"""
+
+
+# Stands for the stored image in the cached values the store answers for
+_STORED = object()
+
+
+class _Entry:
+    __slots__ = ('image', 'nbytes', 'refs', 'spill_path', 'sources')
+
+    def __init__(self, image):
+        self.image = image
+        self.nbytes = image.nbytes
+        self.refs = 0
+        self.spill_path = None
+        # Result cache keys whose values held this image
+        self.sources = []
+
+
+class ImageHandle:
+    """A session's reference to an image in the store"""
+
+    def __init__(self, store, key, owner, nbytes):
+        self.key = key
+        self.owner = owner
+        self.nbytes = nbytes
+        self._finalizer = weakref.finalize(self, store._release, key, owner)
+        self._store = store
+
+    def get(self):
+        """Return the read-only image, reading it back from disk if it was spilled"""
+        return self._store._get(self.key)
+
+    def release(self):
+        """Drop this reference now instead of when the handle is collected"""
+        self._finalizer()
+
+
+class ImageStore:
+    """Deduplicating, reference-counted image store with disk spill"""
+
+    def __init__(self, max_bytes, session_max_bytes, spill_dir=None, cache=None):
+        self.max_bytes = max_bytes
+        self.session_max_bytes = session_max_bytes
+        self._spill_parent = spill_dir
+        self._spill_dir = None
+        self._cache = cache
+        if cache is not None:
+            cache.fallback = self.lookup
+        # Result cache key: (store key, cached value with the image as _STORED)
+        self._sources = {}
+        self._entries = OrderedDict()
+        self._owners = {}
+        # Reentrant: a handle collected by the garbage collector while this
+        # thread holds the lock releases its image from inside the lock
+        self._lock = threading.RLock()
+        self.resident_bytes = 0
+        self.spills = 0
+        self.reloads = 0
+        self.deduplicated = 0
+
+    def put(self, image, owner):
+        """Store image for owner (a session id) and return a handle to it
+
+        Raises ImageLimitError when owner would exceed the per-session cap.
+        """
+        key = image_key(image)
+        with self._lock:
+            held = self._owners.get(owner, {})
+            entry = self._entries.get(key)
+            nbytes = entry.nbytes if entry is not None else image.nbytes
+            if key not in held:
+                total = sum(self._entries[k].nbytes for k in held) + nbytes
+                if total > self.session_max_bytes:
+                    raise ImageLimitError(
+                        f"This image needs {nbytes / 1024 ** 2:,.0f} MB, which would bring this "
+                        f"session to {total / 1024 ** 2:,.0f} MB of images; the limit is "
+                        f"{self.session_max_bytes / 1024 ** 2:,.0f} MB. Load a smaller image "
+                        f"or close the images you no longer need.")
+
+            if entry is None:
+                if not image.flags.writeable:
+                    stored = image
+                else:
+                    # Keep a private copy so callers cannot change the stored pixels
+                    stored = freeze(np.array(image))
+                entry = _Entry(stored)
+                self._entries[key] = entry
+                self.resident_bytes += entry.nbytes
+            else:
+                self.deduplicated += 1
+                self._entries.move_to_end(key)
+            if self._cache is not None and not image.flags.writeable:
+                # Stored or a duplicate of a stored image: either way the
+                # cache should not pin it next to the store
+                for source, value in self._cache.discard_array(image):
+                    if isinstance(value, (tuple, list)):
+                        value = type(value)(_STORED if v is image else v for v in value)
+                    else:
+                        value = _STORED
+                    self._sources[source] = (key, value)
+                    entry.sources.append(source)
+            entry.refs += 1
+            held = self._owners.setdefault(owner, {})
+            held[key] = held.get(key, 0) + 1
+            self._evict(keep=key)
+        return ImageHandle(self, key, owner, nbytes)
+
+    def lookup(self, source):
+        """Value once cached under the result cache key source, rebuilt around
+        the stored image, or None when that image is no longer stored"""
+        with self._lock:
+            found = self._sources.get(source)
+            if found is None:
+                return None
+            key, value = found
+            image = self._get(key)
+            if value is _STORED:
+                return image
+            return type(value)(image if v is _STORED else v for v in value)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            if entry.image is None:
+                image = np.load(entry.spill_path)
+                image.flags.writeable = False
+                entry.image = image
+                self.resident_bytes += entry.nbytes
+                self.reloads += 1
+                self._evict(keep=key)
+            return entry.image
+
+    def _release(self, key, owner):
+        with self._lock:
+            held = self._owners.get(owner)
+            if held is not None and key in held:
+                held[key] -= 1
+                if held[key] == 0:
+                    del held[key]
+                if not held:
+                    del self._owners[owner]
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                del self._entries[key]
+                self._drop(entry)
+
+    def _drop(self, entry):
+        for source in entry.sources:
+            self._sources.pop(source, None)
+        if entry.image is not None:
+            self.resident_bytes -= entry.nbytes
+            entry.image = None
+        if entry.spill_path is not None:
+            try:
+                os.remove(entry.spill_path)
+            except OSError:
+                pass
+            entry.spill_path = None
+
+    def _evict(self, keep):
+        """Spill least recently used images until the resident set fits the ceiling"""
+        for key, entry in list(self._entries.items()):
+            if self.resident_bytes <= self.max_bytes:
+                break
+            if key == keep or entry.image is None:
+                continue
+            if entry.spill_path is None:
+                entry.spill_path = os.path.join(self._spill_directory(), f"{key}.npy")
+                np.save(entry.spill_path, entry.image)
+            entry.image = None
+            self.resident_bytes -= entry.nbytes
+            self.spills += 1
+
+    def _spill_directory(self):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='ipl-spill-', dir=self._spill_parent)
+            atexit.register(shutil.rmtree, self._spill_dir, True)
+        return self._spill_dir
+
+    def owner_bytes(self, owner):
+        """Bytes of the images owner currently holds"""
+        with self._lock:
+            return sum(self._entries[k].nbytes for k in self._owners.get(owner, {}))
+
+    def stats(self):
+        """Return counters and memory usage for the Cache Statistics panel"""
+        with self._lock:
+            spilled = [e for e in self._entries.values() if e.image is None]
+            return {
+                'Images': len(self._entries),
+                'Sessions': len(self._owners),
+                'Resident Bytes': self.resident_bytes,
+                'Ceiling Bytes': self.max_bytes,
+                'Spilled Images': len(spilled),
+                'Spilled Bytes': sum(e.nbytes for e in spilled),
+                'Spills': self.spills,
+                'Reloads': self.reloads,
+                'Deduplicated Loads': self.deduplicated,
+            }
+
+
+# Process-wide store shared by every session
+shared_store = ImageStore(settings.IMAGE_STORE_BYTES, settings.SESSION_IMAGE_BYTES,
+                          settings.IMAGE_SPILL_DIR, shared_cache)
@@ -0,0 +1,328 @@
+"""Load test of concurrent sessions driving the app headlessly
+
+Example::
+
+    python load_test.py --sessions 8 --moves 20 --output load.json
+    python load_test.py --sessions 8 --resolution "12 MP (4000 x 3000)" --output new.json \
+        --compare load.json --threshold 0.15
+    python load_test.py --sessions 4 --upload 6000x4000 --upload-format jpeg --distinct
+
+Every session is a Streamlit ``AppTest`` (Streamlit 1.28 or later) running
+``streamlit_image_app.py`` in this process, on its own thread, as the
+sessions of one server worker do; nothing is sent over the network and no
+browser is involved. A session loads a sample image, or an upload of the
+given size, then moves the chosen sliders to random values at ``--rate``
+moves per second until it has made ``--moves`` moves. The report gives the
+p50/p95/p99 latency of those reruns, the reruns per second of all sessions
+together and the peak resident memory of the process, and is written to
+JSON. With ``--compare`` the script exits with status 1 when a latency
+percentile rose, or the throughput fell, by more than the threshold fraction.
+
+AppTest has no file uploader in Streamlit 1.28, so uploads are decoded by
+``load_upload`` here and handed to the session the way the uploader branch
+of the app does.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from unittest import mock
+
+import numpy as np
+import streamlit
+from PIL import Image
+
+from image_decode import load_upload
+from image_store import shared_store
+from samples import SAMPLE_NAMES, generate_sample
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_image_app.py')
+
+# Slider label: range of the values a session moves it to
+SLIDERS = {
+    'Gaussian Blur': (0, 10),
+    'Brightness': (-100, 100),
+    'Low Threshold': (0, 255),
+    'Kernel Size': (3, 201),
+}
+# Short names accepted by --sliders
+SLIDER_NAMES = {'blur': 'Gaussian Blur', 'brightness': 'Brightness',
+                'canny': 'Low Threshold', 'kernel': 'Kernel Size'}
+
+PERCENTILES = (50, 95, 99)
+
+
+def _wait_for_script(runner, timeout=3):
+    """Wait for a script run to end, like AppTest does, without polling
+
+    AppTest checks every 100 ms whether the run has ended, which rounds the
+    measured latency up, and reads the shutdown event of the run before the
+    script thread has necessarily sent it. Joining the script thread waits
+    exactly until that event has been sent.
+    """
+    runner._script_thread.join(timeout)
+    if runner._script_thread.is_alive():
+        runner.request_stop()
+        runner.join()
+        raise RuntimeError(f"AppTest script run timed out after {timeout}s")
+
+
+@contextmanager
+def concurrent_app_tests():
+    """Let AppTest sessions run on several threads at once
+
+    Each AppTest run installs a mock Streamlit runtime and removes it when it
+    finishes, which would pull the runtime out from under the other sessions'
+    threads; one runtime stays installed instead. Each run also compiles the
+    script into a cache of its own, and compiling concurrently is not safe
+    before Python 3.12; the sessions share one cache, as on a real server.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import local_script_runner
+
+    runtime = mock.MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage('/mock/media'))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    script_cache = ScriptCache()
+    with mock.patch.object(local_script_runner, 'ScriptCache', lambda: script_cache), \
+            mock.patch.object(Runtime, 'instance', classmethod(lambda cls: runtime)), \
+            mock.patch.object(Runtime, 'exists', classmethod(lambda cls: True)), \
+            mock.patch.object(local_script_runner, 'require_widgets_deltas', _wait_for_script):
+        yield
+
+
+def encode_upload(image, fmt):
+    """Bytes of image as an uploaded JPEG or PNG file"""
+    buf = BytesIO()
+    Image.fromarray(image).save(buf, format=fmt.upper())
+    return buf.getvalue()
+
+
+def _widget(elements, label):
+    return next(element for element in elements if element.label == label)
+
+
+class Session:
+    """One simulated user: loads an image, then moves sliders at a set rate"""
+
+    def __init__(self, index, args, upload=None):
+        self.index = index
+        self.args = args
+        self.upload = upload
+        self.rng = random.Random(args.seed + index)
+        self.latencies = []
+        self.errors = []
+        self.app = None
+
+    def _run(self, widget=None, record=False):
+        target = widget if widget is not None else self.app
+        started = time.perf_counter()
+        target.run()
+        elapsed = time.perf_counter() - started
+        if record:
+            self.latencies.append(elapsed)
+        for exception in self.app.exception:
+            self.errors.append(exception.value)
+        return elapsed
+
+    def load_image(self):
+        """Open the app and load this session's image"""
+        from streamlit.testing.v1 import AppTest
+
+        self.app = AppTest.from_file(APP_FILE, default_timeout=600)
+        if self.upload is not None:
+            owner = f'load-test-{self.index}'
+            image, reduced = load_upload(BytesIO(self.upload))
+            self.app.session_state['image_owner'] = owner
+            self.app.session_state['image'] = shared_store.put(image, owner)
+            self.app.session_state['image_reduced'] = reduced
+            self._run()
+            return
+        self._run()
+        _widget(self.app.button, 'Sample Images').click()
+        self._run()
+        _widget(self.app.selectbox, 'Choose a sample image:').set_value(self.args.sample)
+        _widget(self.app.selectbox, 'Resolution:').set_value(self.args.resolution)
+        _widget(self.app.button, 'Load Selected Sample').click()
+        self._run()
+
+    def enable_sliders(self):
+        """Show the Canny and Kernel Size sliders when they are to be moved"""
+        # Fast Preview is only offered for images larger than the preview
+        preview = [box for box in self.app.checkbox if box.label == 'Fast Preview']
+        if preview and not self.args.preview:
+            self._run(preview[0].uncheck())
+        if 'Low Threshold' in self.args.sliders:
+            self._run(_widget(self.app.checkbox, 'Enable Edge Detection').check())
+        if 'Kernel Size' in self.args.sliders:
+            self._run(_widget(self.app.selectbox, 'Operation Type').set_value(self.args.morphology))
+
+    def move_sliders(self):
+        interval = 1.0 / self.args.rate
+        for move in range(self.args.moves):
+            label = self.args.sliders[move % len(self.args.sliders)]
+            low, high = SLIDERS[label]
+            if label == 'Kernel Size':
+                value = 2 * self.rng.randint(low // 2, min(high, self.args.max_kernel) // 2) + 1
+            else:
+                value = self.rng.randint(low, high)
+            elapsed = self._run(_widget(self.app.slider, label).set_value(value), record=True)
+            time.sleep(max(0.0, interval - elapsed))
+
+    def __call__(self, ready, start):
+        try:
+            self.load_image()
+            self.enable_sliders()
+        except Exception as error:  # noqa: BLE001 - reported with the results
+            self.errors.append(f'setup: {error!r}')
+            ready.wait()
+            return
+        ready.wait()
+        start.wait()
+        try:
+            self.move_sliders()
+        except Exception as error:  # noqa: BLE001
+            self.errors.append(f'rerun: {error!r}')
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_load_test(args):
+    upload = None
+    if args.upload:
+        width, height = (int(side) for side in args.upload.lower().split('x'))
+    sessions = []
+    for index in range(args.sessions):
+        if args.upload:
+            if upload is None or args.distinct:
+                image = generate_sample(args.sample, (width, height), seed=index)
+                upload = encode_upload(image, args.upload_format)
+        sessions.append(Session(index, args, upload))
+
+    # Every session signals ready after its setup; then all move sliders together
+    ready = threading.Barrier(args.sessions + 1)
+    start = threading.Event()
+    threads = [threading.Thread(target=session, args=(ready, start), name=f'session-{i}')
+               for i, session in enumerate(sessions)]
+    with concurrent_app_tests():
+        setup_started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        ready.wait()
+        setup_seconds = time.perf_counter() - setup_started
+        started = time.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - started
+
+    latencies = np.array([t for session in sessions for t in session.latencies])
+    errors = [error for session in sessions for error in session.errors]
+    results = {
+        'reruns': int(latencies.size),
+        'errors': len(errors),
+        'setup_seconds': setup_seconds,
+        'wall_seconds': wall_seconds,
+        'throughput_reruns_per_second': latencies.size / wall_seconds if wall_seconds else 0.0,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+    if latencies.size:
+        for p in PERCENTILES:
+            results[f'p{p}_ms'] = float(np.percentile(latencies, p) * 1000)
+        results['mean_ms'] = float(latencies.mean() * 1000)
+        results['max_ms'] = float(latencies.max() * 1000)
+    return results, errors
+
+
+def compare(results, baseline, threshold):
+    """Print the metrics worse than baseline by more than threshold; return them"""
+    regressions = []
+    for name in [f'p{p}_ms' for p in PERCENTILES] + ['throughput_reruns_per_second']:
+        if name not in results or not baseline.get(name):
+            continue
+        ratio = results[name] / baseline[name]
+        worse = ratio < 1 - threshold if name.startswith('throughput') else ratio > 1 + threshold
+        if worse:
+            regressions.append(name)
+            print(f"REGRESSION {name}: {baseline[name]:.2f} -> {results[name]:.2f} ({ratio:.2f}x)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the app with concurrent headless sessions")
+    parser.add_argument('--sessions', type=int, default=8, help="Concurrent sessions")
+    parser.add_argument('--moves', type=int, default=20, help="Slider moves per session")
+    parser.add_argument('--rate', type=float, default=2.0, help="Slider moves per second per session")
+    parser.add_argument('--sliders', nargs='+', choices=list(SLIDER_NAMES),
+                        default=list(SLIDER_NAMES), help="Sliders to move, in turn")
+    parser.add_argument('--max-kernel', type=int, default=31, help="Largest Kernel Size moved to")
+    parser.add_argument('--morphology', default='Dilation', help="Operation used with Kernel Size")
+    parser.add_argument('--sample', default='Portrait Style', choices=SAMPLE_NAMES,
+                        help="Sample image loaded, or drawn as the upload")
+    parser.add_argument('--resolution', default='Native', help="Resolution option of the sample")
+    parser.add_argument('--upload', metavar='WxH', help="Upload an image of this size instead")
+    parser.add_argument('--upload-format', default='jpeg', choices=('jpeg', 'png'))
+    parser.add_argument('--distinct', action='store_true',
+                        help="Give every session a different upload instead of the same file")
+    parser.add_argument('--preview', action=argparse.BooleanOptionalAction, default=True,
+                        help="Keep Fast Preview on for images larger than the preview")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the slider values")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Baseline JSON file from an earlier run")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Allowed worsening fraction before a metric counts as a regression")
+    args = parser.parse_args(argv)
+    args.sliders = [SLIDER_NAMES[name] for name in args.sliders]
+
+    if importlib.util.find_spec('streamlit.testing') is None:
+        parser.error("AppTest needs Streamlit 1.28 or later")
+
+    results, errors = run_load_test(args)
+    for error in errors[:10]:
+        print(f"error: {error}")
+    for name, value in results.items():
+        print(f"{name:<30} {value:14,.2f}")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'streamlit': streamlit.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'config': {name: value for name, value in vars(args).items()
+                       if name not in ('output', 'compare', 'threshold')},
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
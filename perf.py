@@ -0,0 +1,170 @@
+"""Lightweight per-session timing and memory instrumentation
+
+Code marks interesting spans with ``measure(name, category)``. The call is a
+no-op unless a ``PerfRecorder`` has been activated for the current thread,
+which the app does on every rerun while the "Record Performance" option is
+on. Streamlit runs each rerun of a session in its own script thread, so
+recorders of concurrent sessions never see each other's spans.
+
+Peak memory comes from ``tracemalloc``, which NumPy (and therefore every
+OpenCV output array) reports its allocations to. ``tracemalloc`` is process
+wide, so when several sessions record at the same time the peaks include
+their allocations too. A recorder that is garbage collected while tracing
+(its session closed with the option on) gives up its share of
+``tracemalloc`` then.
+"""
+import csv
+import io
+import json
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+FIELDS = ('run', 'name', 'category', 'seconds', 'peak_bytes')
+
+_local = threading.local()
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+class PerfRecorder:
+    """Ring buffer of timing records for one session"""
+
+    def __init__(self, capacity):
+        self.records = deque(maxlen=capacity)
+        self.run = 0
+        self.memory_tracing = False
+        self._tracing = None
+        self._run_started = None
+        self._frames = []
+
+    def set_memory_tracing(self, enabled):
+        """Turn peak-memory measurement on or off for this recorder"""
+        if enabled and not self.memory_tracing:
+            enable_memory_tracing()
+            # Released here when tracing is turned off, else when the recorder is collected
+            self._tracing = weakref.finalize(self, disable_memory_tracing)
+        elif not enabled and self.memory_tracing:
+            self._tracing()
+            self._tracing = None
+        self.memory_tracing = enabled
+
+    def begin_run(self):
+        self.run += 1
+        self._run_started = time.perf_counter()
+        self._frames = []
+
+    def end_run(self):
+        if self._run_started is not None:
+            self._add('rerun', 'rerun', time.perf_counter() - self._run_started, None)
+            self._run_started = None
+
+    def add_records(self, records):
+        """Add records measured by another recorder (a background job) to the current run"""
+        for record in records:
+            self._add(record['name'], record['category'], record['seconds'], record['peak_bytes'])
+
+    def _add(self, name, category, seconds, peak_bytes):
+        self.records.append({'run': self.run, 'name': name, 'category': category,
+                             'seconds': seconds, 'peak_bytes': peak_bytes})
+
+    @contextmanager
+    def measure(self, name, category):
+        tracing = tracemalloc.is_tracing()
+        frame = {'max_peak': 0, 'start_bytes': 0}
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # Keep the enclosing span's peak before resetting it for this one
+            if self._frames:
+                parent = self._frames[-1]
+                parent['max_peak'] = max(parent['max_peak'], peak)
+            tracemalloc.reset_peak()
+            frame['start_bytes'] = current
+        self._frames.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self._frames.pop()
+            peak_bytes = None
+            if tracing and tracemalloc.is_tracing():
+                peak = max(frame['max_peak'], tracemalloc.get_traced_memory()[1])
+                peak_bytes = max(0, peak - frame['start_bytes'])
+                if self._frames:
+                    parent = self._frames[-1]
+                    parent['max_peak'] = max(parent['max_peak'], peak)
+            self._add(name, category, seconds, peak_bytes)
+
+    def last_run(self):
+        """Records of the most recent rerun that ran to completion"""
+        finished = [r['run'] for r in self.records if r['name'] == 'rerun']
+        if not finished:
+            return []
+        return [r for r in self.records if r['run'] == finished[-1]]
+
+    def summary(self):
+        """Count, mean and max time and max peak memory per span name"""
+        rows = {}
+        for record in self.records:
+            row = rows.setdefault(record['name'], {
+                'name': record['name'], 'category': record['category'], 'count': 0,
+                'total_seconds': 0.0, 'max_seconds': 0.0, 'max_peak_bytes': None})
+            row['count'] += 1
+            row['total_seconds'] += record['seconds']
+            row['max_seconds'] = max(row['max_seconds'], record['seconds'])
+            if record['peak_bytes'] is not None:
+                row['max_peak_bytes'] = max(row['max_peak_bytes'] or 0, record['peak_bytes'])
+        for row in rows.values():
+            row['mean_seconds'] = row.pop('total_seconds') / row['count']
+        return sorted(rows.values(), key=lambda row: -row['mean_seconds'])
+
+    def to_csv(self):
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(self.records)
+        return buf.getvalue()
+
+    def to_json(self):
+        return json.dumps(list(self.records), indent=2)
+
+
+def enable_memory_tracing():
+    """Start tracemalloc for one more user; pair with disable_memory_tracing"""
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def disable_memory_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users = max(0, _tracing_users - 1)
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def activate(recorder):
+    """Send spans measured on the current thread to recorder (None disables)"""
+    _local.recorder = recorder
+
+
+def active_recorder():
+    return getattr(_local, 'recorder', None)
+
+
+@contextmanager
+def measure(name, category='stage'):
+    """Record the wall time and peak allocation of the enclosed block"""
+    recorder = active_recorder()
+    if recorder is None:
+        yield
+        return
+    with recorder.measure(name, category):
+        yield
@@ -0,0 +1,178 @@
+"""Content-addressed, byte-bounded LRU cache for processing results.
+
+The cache lives at module level so that every Streamlit session served by the
+same worker process shares it: the same image processed with the same
+parameters is only ever computed once while it stays within the budget.
+"""
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+import settings
+
+
+def value_nbytes(value):
+    """Approximate the memory held by a cached value"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(value_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(value_nbytes(v) for v in value.values())
+    return 64
+
+
+def freeze(value):
+    """Mark cached arrays read-only so no caller can corrupt a shared entry"""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (tuple, list)):
+        for v in value:
+            freeze(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            freeze(v)
+    return value
+
+
+# Digests of read-only arrays, so an image kept across reruns is hashed once
+_digest_memo = {}
+
+
+def image_key(image):
+    """Return a content hash of an image array (shape, dtype and pixels)"""
+    memo = _digest_memo.get(id(image))
+    if memo is not None and memo[0]() is image:
+        return memo[1]
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((image.shape, image.dtype.str)).encode())
+    h.update(memoryview(np.ascontiguousarray(image)).cast('B'))
+    digest = h.hexdigest()
+
+    # Only immutable arrays can safely reuse their digest
+    if not image.flags.writeable:
+        image_id = id(image)
+        ref = weakref.ref(image, lambda _: _digest_memo.pop(image_id, None))
+        _digest_memo[image_id] = (ref, digest)
+    return digest
+
+
+class ResultCache:
+    """Thread-safe LRU cache bounded by the total size of its values"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Optional callable(key) -> value or None, asked by get_or_compute on a
+        # miss for values that moved out of the cache (into the image store)
+        self.fallback = None
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_last(self, keys):
+        """Return (index, value) for the last of keys that is cached, or (-1, None)
+
+        The probe counts as one lookup, a single hit or miss, however many
+        keys it tries.
+        """
+        with self._lock:
+            for i in range(len(keys) - 1, -1, -1):
+                entry = self._entries.get(keys[i])
+                if entry is not None:
+                    self._entries.move_to_end(keys[i])
+                    self.hits += 1
+                    return i, entry[0]
+            self.misses += 1
+            return -1, None
+
+    def put(self, key, value):
+        size = value_nbytes(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            # Values larger than the whole budget are returned but never kept
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        value = self.fallback(key) if self.fallback is not None else None
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+        # Compute outside the lock so other sessions are never blocked
+        return self.put(key, freeze(compute()))
+
+    def discard_array(self, array):
+        """Drop every entry holding array, alone or in a tuple or list
+
+        Lets an owner that takes over a cached array (the image store) be the
+        only one keeping it in memory. Returns the (key, value) pairs dropped.
+        """
+        dropped = []
+        with self._lock:
+            for key, (value, size) in list(self._entries.items()):
+                held = value if isinstance(value, (tuple, list)) else (value,)
+                if any(v is array for v in held):
+                    del self._entries[key]
+                    self.current_bytes -= size
+                    dropped.append((key, value))
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return hit/miss counters and memory usage for sizing the budget"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'Hits': self.hits,
+                'Misses': self.misses,
+                'Hit Rate': self.hits / lookups if lookups else 0.0,
+                'Evictions': self.evictions,
+                'Entries': len(self._entries),
+                'Used Bytes': self.current_bytes,
+                'Budget Bytes': self.max_bytes,
+            }
+
+
+# Process-wide cache shared by every session
+shared_cache = ResultCache(settings.RESULT_CACHE_BYTES)
@@ -0,0 +1,111 @@
+"""Synthetic sample images offered on the main page
+
+Every generator is vectorized and accepts any output size up to
+MAX_SAMPLE_PIXELS, so the samples also serve as load-test and benchmark
+inputs. Generated images are cached by (kind, size, seed) in the shared
+result cache, which makes repeated loads free.
+"""
+import cv2
+import numpy as np
+
+from result_cache import shared_cache
+
+SAMPLE_NAMES = ["Portrait Style", "Checkerboard Pattern", "Random Noise", "Color Gradient", "Geometric Shapes"]
+
+# Size (width, height) each sample is drawn at when no size is requested
+NATIVE_SIZES = {
+    "Portrait Style": (512, 512),
+    "Checkerboard Pattern": (400, 400),
+    "Random Noise": (400, 400),
+    "Color Gradient": (400, 400),
+    "Geometric Shapes": (400, 400),
+}
+
+MAX_SAMPLE_PIXELS = 100_000_000
+
+
+def _scaler(size, native):
+    """Return a function mapping native (x, y) coordinates onto size"""
+    sx = size[0] / native[0]
+    sy = size[1] / native[1]
+    return lambda x, y: (round(x * sx), round(y * sy))
+
+
+def _disc(image, center, radius, color, scale):
+    # Circles stay circles at the native aspect ratio and become ellipses otherwise
+    cx, cy = scale(*center)
+    rx, ry = scale(radius, radius)
+    if rx == ry:
+        cv2.circle(image, (cx, cy), rx, color, -1)
+    else:
+        cv2.ellipse(image, (cx, cy), (rx, ry), 0, 0, 360, color, -1)
+
+
+def _portrait(size, rng):
+    scale = _scaler(size, NATIVE_SIZES["Portrait Style"])
+    image = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    # Create a simple face-like pattern
+    _disc(image, (256, 256), 200, (255, 220, 177), scale)  # Face
+    _disc(image, (200, 200), 30, (255, 255, 255), scale)   # Left eye
+    _disc(image, (312, 200), 30, (255, 255, 255), scale)   # Right eye
+    _disc(image, (200, 200), 15, (50, 50, 150), scale)     # Left pupil
+    _disc(image, (312, 200), 15, (50, 50, 150), scale)     # Right pupil
+    cv2.ellipse(image, scale(256, 320), scale(60, 30), 0, 0, 180, (200, 100, 100), -1)  # Mouth
+    return image
+
+
+def _checkerboard(size, rng):
+    # 8x8 squares: build the two alternating pixel rows once, then pick one per row
+    rows = np.arange(size[1]) * 8 // size[1]
+    cols = np.arange(size[0]) * 8 // size[0]
+    palette = np.array([[240, 240, 240], [40, 40, 40]], dtype=np.uint8)
+    pixel_rows = np.stack([palette[cols & 1], palette[(cols + 1) & 1]])
+    return np.take(pixel_rows, rows & 1, axis=0)
+
+
+def _noise(size, rng):
+    return rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+
+
+def _gradient(size, rng):
+    height = size[1]
+    i = np.arange(height)
+    row_colors = np.stack([i * 255 // height, (height - i) * 255 // height,
+                           np.full(height, 128)], axis=1).astype(np.uint8)
+    return np.repeat(row_colors[:, None, :], size[0], axis=1)
+
+
+def _shapes(size, rng):
+    scale = _scaler(size, NATIVE_SIZES["Geometric Shapes"])
+    image = np.full((size[1], size[0], 3), 245, dtype=np.uint8)  # Light background
+    cv2.rectangle(image, scale(50, 50), scale(150, 150), (220, 50, 50), -1)  # Red square
+    _disc(image, (300, 100), 50, (50, 220, 50), scale)                       # Green circle
+    points = np.array([scale(200, 200), scale(300, 300), scale(100, 300)], np.int32)
+    cv2.fillPoly(image, [points], (50, 50, 220))                             # Blue triangle
+    return image
+
+
+_GENERATORS = {
+    "Portrait Style": _portrait,
+    "Checkerboard Pattern": _checkerboard,
+    "Random Noise": _noise,
+    "Color Gradient": _gradient,
+    "Geometric Shapes": _shapes,
+}
+
+
+def generate_sample(sample_choice, size=None, seed=0):
+    """Generate one of the SAMPLE_NAMES images as a read-only RGB array
+
+    size is (width, height) and defaults to the sample's native size; seed
+    only affects "Random Noise".
+    """
+    if sample_choice not in _GENERATORS:
+        raise ValueError(f"Unknown sample image: {sample_choice}")
+    size = tuple(size) if size is not None else NATIVE_SIZES[sample_choice]
+    if size[0] < 1 or size[1] < 1 or size[0] * size[1] > MAX_SAMPLE_PIXELS:
+        raise ValueError(f"Sample size must be between 1 and {MAX_SAMPLE_PIXELS} pixels")
+    
+    key = ('sample', sample_choice, size, seed)
+    generator = _GENERATORS[sample_choice]
+    return shared_cache.get_or_compute(key, lambda: generator(size, np.random.default_rng(seed)))
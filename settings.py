@@ -0,0 +1,74 @@
+"""Runtime settings for the Image Processing Laboratory.
+
+Every value can be overridden with an environment variable of the same name
+prefixed with ``IPL_``, for example ``IPL_RESULT_CACHE_BYTES=1073741824``.
+"""
+import os
+
+
+def _env_int(name, default):
+    """Read an integer setting from the environment"""
+    value = os.environ.get(f"IPL_{name}")
+    if value is None or value.strip() == "":
+        return default
+    return int(value)
+
+
+def _env_str(name, default):
+    """Read a string setting from the environment"""
+    value = os.environ.get(f"IPL_{name}")
+    if value is None or value.strip() == "":
+        return default
+    return value
+
+
+# Byte budget of the process-wide result cache shared by all sessions
+RESULT_CACHE_BYTES = _env_int("RESULT_CACHE_BYTES", 512 * 1024 * 1024)
+
+# Longest side, in pixels, of the proxy rendered while adjusting sliders
+PREVIEW_MAX_SIDE = _env_int("PREVIEW_MAX_SIDE", 1280)
+
+# Working memory of one band in tiled processing, and the image size at
+# which full-resolution renders switch to the tiled path
+TILE_BAND_BYTES = _env_int("TILE_BAND_BYTES", 64 * 1024 * 1024)
+TILED_MIN_PIXELS = _env_int("TILED_MIN_PIXELS", 50_000_000)
+
+# Directory for the memory-mapped scratch files of tiled processing
+# (None uses the system temporary directory)
+TILE_WORK_DIR = _env_str("TILE_WORK_DIR", None)
+
+# Worker threads for band-parallel processing, and the image size from which
+# full-resolution renders use them
+PARALLEL_WORKERS = _env_int("PARALLEL_WORKERS", os.cpu_count() or 1)
+PARALLEL_MIN_PIXELS = _env_int("PARALLEL_MIN_PIXELS", 4_000_000)
+
+# Timing records kept per session by the Performance panel
+PERF_HISTORY = _env_int("PERF_HISTORY", 2000)
+
+# Longest a live stream runs before it stops by itself
+STREAM_MAX_SECONDS = _env_int("STREAM_MAX_SECONDS", 600)
+
+# Background threads that render and encode downloads
+EXPORT_WORKERS = _env_int("EXPORT_WORKERS", 2)
+
+# Memory ceiling of the images sessions work on (shared and deduplicated),
+# beyond which the least recently used are spilled to disk, and the image
+# bytes one session may hold
+IMAGE_STORE_BYTES = _env_int("IMAGE_STORE_BYTES", 1024 * 1024 * 1024)
+SESSION_IMAGE_BYTES = _env_int("SESSION_IMAGE_BYTES", 1024 * 1024 * 1024)
+
+# Directory for the spill files of the image store (None uses the system
+# temporary directory)
+IMAGE_SPILL_DIR = _env_str("IMAGE_SPILL_DIR", None)
+
+# Image size from which the interactive statistics and charts are estimated
+# from a sample of pixels, and the number of pixels sampled
+APPROX_STATS_MIN_PIXELS = _env_int("APPROX_STATS_MIN_PIXELS", 20_000_000)
+APPROX_STATS_SAMPLE_PIXELS = _env_int("APPROX_STATS_SAMPLE_PIXELS", 1_000_000)
+
+# Worker threads of the Batch Compare workspace, each holding one image's
+# intermediate results at a time
+BATCH_WORKERS = _env_int("BATCH_WORKERS", min(4, os.cpu_count() or 1))
+
+# Bytes of free stage buffers a headless batch worker keeps between images
+BATCH_POOL_BYTES = _env_int("BATCH_POOL_BYTES", 512 * 1024 * 1024)
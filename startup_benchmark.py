@@ -0,0 +1,138 @@
+"""Benchmark of cold-start time: imports and the app's first render
+
+Example::
+
+    python startup_benchmark.py --output startup.json
+    python startup_benchmark.py --output new.json --compare startup.json --threshold 0.15
+
+Every case runs in a fresh interpreter, as a new worker or pod would, and is
+repeated ``--repeat`` times; the median and minimum wall times are written to
+JSON. The cases are the bare interpreter, ``import streamlit``, the import of
+the app's own modules, and a first run of ``streamlit_image_app.py`` through
+Streamlit's ``AppTest`` (time to first render, which needs Streamlit 1.28 or
+later).
+
+Each case also records which heavy libraries were loaded when it finished.
+Streamlit imports some of them itself, so the one to watch is
+``import_app_modules``: it should load none, and a module that starts
+importing one at the top level again shows up there. With ``--compare`` the
+script exits with status 1 when any case's median got slower by more than the
+threshold fraction.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmark import compare
+
+APP_FILE = 'streamlit_image_app.py'
+
+# Modules imported at the top of the app script
+APP_MODULES = ('perf', 'settings', 'batch_workspace', 'buffer_pool', 'charts', 'export_encoding',
+               'image_decode', 'image_processing', 'image_stats', 'image_store', 'morphology',
+               'result_cache', 'samples', 'streaming', 'tiled_processing')
+
+# Libraries that only the charts, or nothing at all, should pull in
+HEAVY_MODULES = ('plotly', 'pandas', 'matplotlib', 'requests')
+
+# Printed by every case so that the report can list the heavy modules loaded
+_REPORT_LOADED = f"""
+import json, sys
+print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))
+"""
+
+_FIRST_RENDER = f"""
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({APP_FILE!r}, default_timeout=600)
+app.run()
+for error in app.exception:
+    print('app exception:', error.value)
+"""
+
+
+def startup_cases():
+    """Return (case name, Python source run with -c) pairs"""
+    return [
+        ('interpreter', 'pass'),
+        ('import_streamlit', 'import streamlit'),
+        ('import_app_modules', 'import ' + ', '.join(APP_MODULES)),
+        ('first_render', _FIRST_RENDER),
+    ]
+
+
+def run_fresh(source):
+    """Run source in a new interpreter; return (wall seconds, stdout)"""
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', source], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    return time.perf_counter() - started, completed.stdout
+
+
+def time_case(source, repeat):
+    """Median and minimum wall time of repeat fresh runs, and the heavy modules loaded"""
+    timings = []
+    for _ in range(repeat):
+        seconds, output = run_fresh(source + _REPORT_LOADED)
+        timings.append(seconds)
+    lines = output.strip().splitlines()
+    for line in lines[:-1]:
+        print(line)
+    return {'median': statistics.median(timings), 'min': min(timings), 'runs': repeat,
+            'loaded': json.loads(lines[-1])}
+
+
+def run_benchmarks(repeat, selected=None):
+    results = {}
+    for name, source in startup_cases():
+        if selected and not any(part in name for part in selected):
+            continue
+        if name == 'first_render' and importlib.util.find_spec('streamlit.testing') is None:
+            print("first_render skipped: AppTest needs Streamlit 1.28 or later")
+            continue
+        results[name] = time_case(source, repeat)
+        print(f"{name:<24} {results[name]['median'] * 1000:10.1f} ms   "
+              f"loaded: {', '.join(results[name]['loaded']) or '-'}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import and first render time")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per case")
+    parser.add_argument('--cases', nargs='+', help="Only run cases whose name contains one of these")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Baseline JSON file from an earlier run")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Allowed slowdown fraction before a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.repeat, args.cases)
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
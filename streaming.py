@@ -0,0 +1,197 @@
+"""Continuous processing of a live frame stream within a latency budget
+
+A frame source (camera, video file or synthetic generator) is read on a
+background thread that only ever keeps the newest frame, so frames that
+arrive while the pipeline is busy are dropped instead of queuing up. Frames
+that are already older than the latency budget when the processor gets to
+them are dropped as well. ``run_stream`` drives the loop and reports the
+achieved frame rate and per-frame latency; it has no Streamlit dependency,
+so it can be exercised with ``SyntheticSource`` on machines without a camera.
+"""
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from buffer_pool import BufferPool
+from image_processing import apply_image_processing
+
+
+class SyntheticSource:
+    """Moving test pattern produced at a fixed frame rate"""
+
+    def __init__(self, width=640, height=480, fps=30):
+        self.fps = fps
+        self._index = 0
+        self._next = time.perf_counter()
+        yy, xx = np.mgrid[0:height, 0:width]
+        self._base = ((xx + yy) % 256).astype(np.uint8)
+
+    def read(self):
+        # Pace like a real camera
+        delay = self._next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next + 1 / self.fps, time.perf_counter())
+        
+        shift = self._index * 4
+        self._index += 1
+        frame = np.dstack([np.roll(self._base, shift, axis=1), np.roll(self._base, -shift, axis=0),
+                           np.full_like(self._base, 128)])
+        cx = int((np.sin(self._index / 15) * 0.4 + 0.5) * frame.shape[1])
+        cv2.circle(frame, (cx, frame.shape[0] // 2), frame.shape[0] // 6, (255, 255, 255), -1)
+        return frame
+
+    def release(self):
+        pass
+
+
+class VideoCaptureSource:
+    """Frames from an OpenCV capture: a camera index or a video file path
+
+    Video files are paced to their own frame rate and loop when they end.
+    """
+
+    def __init__(self, target, loop=True):
+        self._capture = cv2.VideoCapture(target)
+        if not self._capture.isOpened():
+            raise ValueError(f"Could not open video source {target!r}")
+        is_file = not isinstance(target, int)
+        self._loop = loop and is_file
+        fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self._interval = 1 / fps if is_file and fps > 0 else 0
+        self._next = time.perf_counter()
+
+    def read(self):
+        if self._interval:
+            delay = self._next - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._next = max(self._next + self._interval, time.perf_counter())
+        ok, frame = self._capture.read()
+        if not ok and self._loop:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._capture.read()
+        if not ok:
+            return None
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def release(self):
+        self._capture.release()
+
+
+class LatestFrameGrabber:
+    """Reads a source on a thread, keeping only the newest frame"""
+
+    def __init__(self, source):
+        self.source = source
+        self.captured = 0
+        self.overwritten = 0
+        self.finished = False
+        self._frame = None
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped:
+            frame = self.source.read()
+            with self._condition:
+                if frame is None:
+                    self.finished = True
+                    self._condition.notify_all()
+                    return
+                if self._frame is not None:
+                    self.overwritten += 1
+                self._frame = (frame, time.perf_counter())
+                self.captured += 1
+                self._condition.notify_all()
+
+    def take(self, timeout=1.0):
+        """Return (frame, capture time) of the newest unread frame, or None"""
+        with self._condition:
+            if self._frame is None and not self.finished:
+                self._condition.wait(timeout)
+            item, self._frame = self._frame, None
+            return item
+
+    def stop(self):
+        """Stop reading and release the source once the thread is out of read()"""
+        self._stopped = True
+        self._thread.join()
+        self.source.release()
+
+
+class StreamStats:
+    """Frame rate and latency over a sliding window of processed frames"""
+
+    def __init__(self, window=60):
+        self._done = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)
+        self.processed = 0
+        self.dropped_late = 0
+        self.last_latency = 0.0
+
+    def add(self, finished, latency):
+        self._done.append(finished)
+        self._latencies.append(latency)
+        self.processed += 1
+        self.last_latency = latency
+
+    @property
+    def fps(self):
+        if len(self._done) < 2:
+            return 0.0
+        return (len(self._done) - 1) / (self._done[-1] - self._done[0])
+
+    @property
+    def mean_latency(self):
+        return sum(self._latencies) / len(self._latencies) if self._latencies else 0.0
+
+
+def run_stream(source, params, latency_budget, on_frame, max_frames=None, max_seconds=None,
+               pool=None):
+    """Process frames from source until it ends or a limit is reached
+
+    on_frame(frame, processed, stats, grabber) is called for every frame that
+    was processed; returning False from it stops the stream. processed is a
+    buffer of pool (a new BufferPool by default) that is reused for a later
+    frame once on_frame returns. Returns the final StreamStats.
+    """
+    if pool is None:
+        pool = BufferPool()
+    grabber = LatestFrameGrabber(source).start()
+    stats = StreamStats()
+    started = time.perf_counter()
+    try:
+        while True:
+            if max_frames is not None and stats.processed >= max_frames:
+                break
+            if max_seconds is not None and time.perf_counter() - started >= max_seconds:
+                break
+            item = grabber.take()
+            if item is None:
+                if grabber.finished:
+                    break
+                continue
+            frame, captured = item
+            if time.perf_counter() - captured > latency_budget:
+                stats.dropped_late += 1
+                continue
+            
+            processed = apply_image_processing(frame, params, pool)
+            finished = time.perf_counter()
+            stats.add(finished, finished - captured)
+            keep_going = on_frame(frame, processed, stats, grabber)
+            pool.release(processed)
+            if keep_going is False:
+                break
+    finally:
+        grabber.stop()
+    return stats
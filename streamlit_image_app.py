@@ -1,13 +1,42 @@
 import streamlit as st
-import cv2
-import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
-from PIL import Image
-import requests
-from io import BytesIO
-import plotly.express as px
-import plotly.graph_objects as go
+import csv
+import io
+import os
+import tempfile
+import time
+import uuid
+
+import perf
+import settings
+from batch_workspace import process_batch
+from buffer_pool import BufferPool
+from charts import distribution_figure, histogram_figure, properties_figure, statistics_figure
+from export_encoding import (DEFAULT_PNG_COMPRESSION, DEFAULT_QUALITY, EXPORT_FORMATS,
+                             export_file_name, export_key, request_export)
+from image_decode import load_upload, upload_digest
+from image_processing import (DEFAULT_PARAMS, make_preview, preview_scale, process_image_cached,
+                              scale_params)
+from image_stats import (CONFIDENCE, INTENSITY_RANGES, calculate_image_stats_cached,
+                         preview_estimate)
+from image_store import ImageLimitError, shared_store
+from morphology import KERNEL_SHAPES
+from perf import PerfRecorder, measure
+from result_cache import image_key, shared_cache
+from samples import SAMPLE_NAMES, generate_sample
+from streaming import SyntheticSource, VideoCaptureSource, run_stream
+from tiled_processing import render_full_resolution
+
+# Views of the analysis section, in display order
+ANALYSIS_VIEWS = ["Histogram Analysis", "Statistical Comparison", "Intensity Distribution"]
+
+# Resolutions offered for the sample images; None keeps the native size
+SAMPLE_SIZES = {
+    "Native": None,
+    "1 MP (1000 x 1000)": (1000, 1000),
+    "12 MP (4000 x 3000)": (4000, 3000),
+    "50 MP (8660 x 5773)": (8660, 5773),
+    "100 MP (12000 x 8333)": (12000, 8333),
+}
 
 # Configure page
 st.set_page_config(
@@ -135,15 +164,15 @@ st.markdown("""
         box-shadow: 0 8px 20px rgba(0,0,0,0.2);
     }
     
-    /* Tab styling */
-    .stTabs [data-baseweb="tab-list"] {
+    /* Analysis view selector styling */
+    .stRadio [role="radiogroup"] {
         background: rgba(255, 255, 255, 0.7);
         border-radius: 10px;
         padding: 0.25rem;
         box-shadow: 0 4px 15px rgba(0,0,0,0.08);
     }
     
-    .stTabs [data-baseweb="tab"] {
+    .stRadio [role="radiogroup"] label {
         border-radius: 8px;
         margin: 0.25rem;
     }
@@ -161,80 +190,80 @@ st.markdown("""
 if 'page' not in st.session_state:
     st.session_state.page = 'main'
 if 'image' not in st.session_state:
+    # Handle to the working image in the shared image store, or None
     st.session_state.image = None
+if 'image_owner' not in st.session_state:
+    st.session_state.image_owner = uuid.uuid4().hex
+if 'perf_recorder' not in st.session_state:
+    st.session_state.perf_recorder = PerfRecorder(settings.PERF_HISTORY)
+if 'buffer_pool' not in st.session_state:
+    # Stage buffers reused from frame to frame by this session's live stream
+    st.session_state.buffer_pool = BufferPool()
 
-def calculate_image_stats(image):
-    """Calculate various image statistics"""
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = image
-    
-    stats = {
-        'Width': image.shape[1],
-        'Height': image.shape[0],
-        'Channels': len(image.shape) if len(image.shape) == 2 else image.shape[2],
-        'Mean Brightness': np.mean(gray),
-        'Std Brightness': np.std(gray),
-        'Min Intensity': np.min(gray),
-        'Max Intensity': np.max(gray),
-        'Total Pixels': image.shape[0] * image.shape[1]
-    }
-    return stats, gray
-
-def apply_image_processing(image, params):
-    """Apply image processing based on parameters"""
-    processed = image.copy()
-    
-    # Convert to grayscale if requested
-    if params['grayscale']:
-        if len(processed.shape) == 3:
-            processed = cv2.cvtColor(processed, cv2.COLOR_RGB2GRAY)
-            processed = cv2.cvtColor(processed, cv2.COLOR_GRAY2RGB)
-    
-    # Apply Gaussian blur
-    if params['blur'] > 0:
-        ksize = int(params['blur']) * 2 + 1
-        processed = cv2.GaussianBlur(processed, (ksize, ksize), 0)
-    
-    # Adjust brightness
-    if params['brightness'] != 0:
-        processed = cv2.convertScaleAbs(processed, beta=params['brightness'])
-    
-    # Adjust contrast
-    if params['contrast'] != 1.0:
-        processed = cv2.convertScaleAbs(processed, alpha=params['contrast'])
-    
-    # Apply edge detection
-    if params['edge_detection']:
-        if len(processed.shape) == 3:
-            gray = cv2.cvtColor(processed, cv2.COLOR_RGB2GRAY)
-        else:
-            gray = processed
-        edges = cv2.Canny(gray, params['canny_low'], params['canny_high'])
-        processed = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-    
-    # Apply morphological operations
-    if params['morphology'] != 'None':
-        if len(processed.shape) == 3:
-            gray = cv2.cvtColor(processed, cv2.COLOR_RGB2GRAY)
-        else:
-            gray = processed
-        
-        kernel = np.ones((params['kernel_size'], params['kernel_size']), np.uint8)
-        
-        if params['morphology'] == 'Erosion':
-            gray = cv2.erode(gray, kernel, iterations=1)
-        elif params['morphology'] == 'Dilation':
-            gray = cv2.dilate(gray, kernel, iterations=1)
-        elif params['morphology'] == 'Opening':
-            gray = cv2.morphologyEx(gray, cv2.MORPH_OPEN, kernel)
-        elif params['morphology'] == 'Closing':
-            gray = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
-        
-        processed = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
-    
-    return processed
+
+def property_table(values):
+    """Two-column Property/Value table of a dict, for st.dataframe"""
+    return {'Property': list(values), 'Value': list(values.values())}
+
+
+INTERVAL_COLUMN = f"{CONFIDENCE:.0%} Interval"
+
+
+def format_interval(interval, spec):
+    return '' if interval is None else f"{interval[0]:{spec}} – {interval[1]:{spec}}"
+
+
+def statistics_table(summary):
+    """Property/Value table of ImageStatistics, with intervals when they are sampled"""
+    values = summary.as_dict()
+    table = property_table(values)
+    if summary.approximate:
+        intervals = summary.intervals()
+        table[INTERVAL_COLUMN] = [
+            format_interval(intervals.get(name), ',.2f' if isinstance(value, float) else ',')
+            for name, value in values.items()]
+    return table
+
+
+def range_table(summary):
+    """Estimated pixels per intensity range of sampled ImageStatistics, with intervals"""
+    intervals = summary.intervals()
+    labels = [label for label, _, _ in INTENSITY_RANGES]
+    return {'Range': labels,
+            'Estimated Pixels': summary.range_counts(),
+            INTERVAL_COLUMN: [format_interval(intervals[label], ',.0f') for label in labels]}
+
+
+def clear_session_image():
+    """Release this session's working image with its reduced decode and upload digest"""
+    st.session_state.image = None
+    st.session_state.image_reduced = None
+    st.session_state.image_upload = None
+
+
+def set_session_image(image, reduced=None):
+    """Make image this session's working image; returns it, or None when over the cap"""
+    current = st.session_state.image
+    if current is not None and current.key == image_key(image):
+        return current.get()
+    # Release the previous image first so it does not count against the cap
+    clear_session_image()
+    try:
+        st.session_state.image = shared_store.put(image, st.session_state.image_owner)
+    except ImageLimitError as exc:
+        st.error(str(exc))
+        return None
+    st.session_state.image_reduced = reduced
+    return image
+
+
+# Record timings of this rerun when the Performance panel is switched on
+recorder = st.session_state.perf_recorder
+pending_export = None
+recorder.set_memory_tracing(st.session_state.get('record_performance', False))
+perf.activate(recorder if recorder.memory_tracing else None)
+if recorder.memory_tracing:
+    recorder.begin_run()
 
 # Webcam page
 if st.session_state.page == 'webcam':
@@ -263,19 +292,178 @@ if st.session_state.page == 'webcam':
             </ol>
         </div>
         """, unsafe_allow_html=True)
+        
+        capture_mode = st.radio("Mode", ["Single Photo", "Live Stream"])
     
     with col2:
-        camera_image = st.camera_input("Take a photo")
+        camera_image = st.camera_input("Take a photo") if capture_mode == "Single Photo" else None
         
         if camera_image is not None:
-            image = np.array(Image.open(camera_image))
-            st.session_state.image = image
+            digest = upload_digest(camera_image)
+            if st.session_state.get('image_upload') != digest:
+                image, reduced = load_upload(camera_image)
+                if set_session_image(image, reduced) is not None:
+                    st.session_state.image_upload = digest
+            if st.session_state.get('image_upload') == digest:
+                st.success("Image captured successfully!")
             
-            st.success("Image captured successfully!")
-            
-            if st.button("Process This Image", type="primary", use_container_width=True):
+            if st.session_state.image is not None and st.button(
+                    "Process This Image", type="primary", use_container_width=True):
                 st.session_state.page = 'main'
                 st.rerun()
+        
+        if capture_mode == "Live Stream":
+            st.caption("Every frame runs through the current settings of the main page's "
+                       "processing controls. The server camera is the one attached to the "
+                       "machine running this app.")
+            source_kind = st.selectbox("Frame Source", ["Synthetic Pattern", "Video File", "Server Camera"])
+            video_file = None
+            if source_kind == "Video File":
+                video_file = st.file_uploader("Choose a video file", type=['mp4', 'avi', 'mov', 'mkv'])
+            latency_budget = st.slider("Latency Budget (ms)", 20, 1000, 200, 10)
+            
+            start_col, stop_col = st.columns(2)
+            with start_col:
+                start_stream = st.button("Start Stream", type="primary", use_container_width=True)
+            with stop_col:
+                # Any interaction reruns the script, which ends the running stream
+                st.button("Stop Stream", use_container_width=True)
+            
+            metrics_slot = st.empty()
+            frame_col1, frame_col2 = st.columns(2)
+            with frame_col1:
+                st.markdown("### Camera Frame")
+                original_slot = st.empty()
+            with frame_col2:
+                st.markdown("### Processed Frame")
+                processed_slot = st.empty()
+            
+            if start_stream:
+                def show_frame(frame, processed, stats, grabber):
+                    original_slot.image(frame, use_column_width=True)
+                    processed_slot.image(processed, use_column_width=True)
+                    metrics_slot.markdown(
+                        f"**{stats.fps:.1f} FPS** | latency {stats.last_latency * 1000:.0f} ms "
+                        f"(mean {stats.mean_latency * 1000:.0f} ms) | processed {stats.processed} | "
+                        f"dropped {grabber.overwritten + stats.dropped_late}")
+                
+                video_path = None
+                try:
+                    try:
+                        if source_kind == "Synthetic Pattern":
+                            source = SyntheticSource()
+                        elif source_kind == "Video File":
+                            if video_file is None:
+                                st.error("Choose a video file first")
+                                st.stop()
+                            suffix = os.path.splitext(video_file.name)[1]
+                            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                                tmp.write(video_file.getbuffer())
+                                video_path = tmp.name
+                            source = VideoCaptureSource(video_path)
+                        else:
+                            source = VideoCaptureSource(0)
+                    except ValueError:
+                        source = None
+                        st.error("Could not read this video file" if source_kind == "Video File"
+                                 else "Could not open the server camera")
+                    
+                    if source is not None:
+                        run_stream(source, st.session_state.get('params', DEFAULT_PARAMS),
+                                   latency_budget / 1000, show_frame,
+                                   max_seconds=settings.STREAM_MAX_SECONDS,
+                                   pool=st.session_state.buffer_pool)
+                finally:
+                    if video_path is not None:
+                        os.remove(video_path)
+
+# Batch comparison page
+elif st.session_state.page == 'batch':
+    st.markdown("""
+    <div class="main-header">
+        <h1>Batch Compare</h1>
+        <p>Apply the current adjustments to many images at once</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    if 'batch_images' not in st.session_state:
+        # Upload digest: handle in the shared image store, for the uploaded files
+        st.session_state.batch_images = {}
+    
+    col1, col2 = st.columns([1, 3])
+    
+    with col1:
+        if st.button("← Back to Main", type="primary", use_container_width=True):
+            # The uploads are gone once the uploader leaves the page
+            st.session_state.batch_images = {}
+            st.session_state.page = 'main'
+            st.rerun()
+        
+        uploaded_files = st.file_uploader("Choose image files", type=['png', 'jpg', 'jpeg'],
+                                          accept_multiple_files=True)
+        per_row = st.slider("Thumbnails per Row", 2, 6, 4)
+        show_originals = st.checkbox("Show Originals")
+        
+        batch_params = st.session_state.get('params', DEFAULT_PARAMS)
+        if 'params' in st.session_state:
+            st.caption("Using the adjustments of the main page; change them there.")
+        else:
+            st.caption("Using the default adjustments; load an image on the main page to change them.")
+    
+    # Keep one store handle per distinct image and drop those no longer uploaded
+    names, images = [], []
+    held = {}
+    for uploaded_file in uploaded_files or []:
+        key = upload_digest(uploaded_file)
+        if key not in held:
+            handle = st.session_state.batch_images.get(key)
+            if handle is None:
+                try:
+                    handle = shared_store.put(load_upload(uploaded_file)[0], st.session_state.image_owner)
+                except ImageLimitError as error:
+                    col2.warning(f"{uploaded_file.name}: {error}")
+                    continue
+            held[key] = handle
+        names.append(uploaded_file.name)
+        images.append(held[key].get())
+    st.session_state.batch_images = held
+    
+    with col2:
+        if not images:
+            st.info("Upload images to process them all with the same adjustments.")
+        else:
+            outcomes = process_batch(images, batch_params)
+            
+            for start in range(0, len(outcomes), per_row):
+                for column, name, (result, error) in zip(st.columns(per_row), names[start:],
+                                                         outcomes[start:start + per_row]):
+                    with column:
+                        if error is not None:
+                            st.error(f"{name}: {error}")
+                            continue
+                        if show_originals:
+                            st.image(result.original_thumbnail, caption=f"{name} (original)",
+                                     use_column_width=True)
+                        st.image(result.processed_thumbnail, caption=name, use_column_width=True)
+            
+            st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
+            st.markdown("### Combined Statistics")
+            rows = [result.statistics_row(name)
+                    for name, (result, error) in zip(names, outcomes) if error is None]
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+            
+            if rows:
+                with measure('export:csv', 'export'):
+                    buf = io.StringIO()
+                    writer = csv.DictWriter(buf, fieldnames=list(rows[0]))
+                    writer.writeheader()
+                    writer.writerows(rows)
+                st.download_button(
+                    label="Download Combined Statistics",
+                    data=buf.getvalue(),
+                    file_name="batch_statistics.csv",
+                    mime="text/csv",
+                )
 
 # Main processing page
 elif st.session_state.page == 'main':
@@ -288,7 +476,7 @@ elif st.session_state.page == 'main':
     
     # Image source selection
     st.subheader("Select Image Source")
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         if st.button("Upload File", use_container_width=True):
@@ -303,59 +491,37 @@ elif st.session_state.page == 'main':
         if st.button("Sample Images", use_container_width=True):
             st.session_state.image_source = 'sample'
     
+    with col4:
+        if st.button("Batch Compare", use_container_width=True):
+            st.session_state.page = 'batch'
+            st.rerun()
+    
     st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
     
     # Image loading based on selection
-    image = st.session_state.image if st.session_state.image is not None else None
+    image = st.session_state.image.get() if st.session_state.image is not None else None
     
     # Handle different image sources
     if hasattr(st.session_state, 'image_source'):
         if st.session_state.image_source == 'upload':
             uploaded_file = st.file_uploader("Choose an image file", type=['png', 'jpg', 'jpeg'])
-            if uploaded_file is not None:
-                image = np.array(Image.open(uploaded_file))
-                st.session_state.image = image
+            # The uploader returns the file on every rerun; only decode a new one
+            digest = upload_digest(uploaded_file) if uploaded_file is not None else None
+            if digest is not None and st.session_state.get('image_upload') != digest:
+                image, reduced = load_upload(uploaded_file)
+                image = set_session_image(image, reduced)
+                if image is not None:
+                    st.session_state.image_upload = digest
         
         elif st.session_state.image_source == 'sample':
             sample_choice = st.selectbox(
                 "Choose a sample image:",
-                ["Portrait Style", "Checkerboard Pattern", "Random Noise", "Color Gradient", "Geometric Shapes"]
+                SAMPLE_NAMES
             )
+            sample_size = st.selectbox("Resolution:", list(SAMPLE_SIZES))
             
             if st.button("Load Selected Sample"):
-                if sample_choice == "Portrait Style":
-                    image = np.zeros((512, 512, 3), dtype=np.uint8)
-                    # Create a simple face-like pattern
-                    cv2.circle(image, (256, 256), 200, (255, 220, 177), -1)  # Face
-                    cv2.circle(image, (200, 200), 30, (255, 255, 255), -1)   # Left eye
-                    cv2.circle(image, (312, 200), 30, (255, 255, 255), -1)   # Right eye
-                    cv2.circle(image, (200, 200), 15, (50, 50, 150), -1)     # Left pupil
-                    cv2.circle(image, (312, 200), 15, (50, 50, 150), -1)     # Right pupil
-                    cv2.ellipse(image, (256, 320), (60, 30), 0, 0, 180, (200, 100, 100), -1)  # Mouth
-                
-                elif sample_choice == "Checkerboard Pattern":
-                    image = np.zeros((400, 400, 3), dtype=np.uint8)
-                    for i in range(8):
-                        for j in range(8):
-                            color = [240, 240, 240] if (i + j) % 2 == 0 else [40, 40, 40]
-                            image[i*50:(i+1)*50, j*50:(j+1)*50] = color
-                
-                elif sample_choice == "Random Noise":
-                    image = np.random.randint(0, 255, (400, 400, 3), dtype=np.uint8)
-                
-                elif sample_choice == "Color Gradient":
-                    image = np.zeros((400, 400, 3), dtype=np.uint8)
-                    for i in range(400):
-                        image[i, :] = [i*255//400, (400-i)*255//400, 128]
-                
-                elif sample_choice == "Geometric Shapes":
-                    image = np.ones((400, 400, 3), dtype=np.uint8) * 245  # Light background
-                    cv2.rectangle(image, (50, 50), (150, 150), (220, 50, 50), -1)   # Red square
-                    cv2.circle(image, (300, 100), 50, (50, 220, 50), -1)            # Green circle
-                    points = np.array([[200, 200], [300, 300], [100, 300]], np.int32)
-                    cv2.fillPoly(image, [points], (50, 50, 220))                     # Blue triangle
-                
-                st.session_state.image = image
+                image = set_session_image(generate_sample(sample_choice, SAMPLE_SIZES[sample_size]))
     
     # Main processing interface
     if image is not None:
@@ -399,80 +565,166 @@ elif st.session_state.page == 'main':
             params['morphology'] = st.selectbox("Operation Type", 
                                               ["None", "Erosion", "Dilation", "Opening", "Closing"])
             if params['morphology'] != 'None':
-                params['kernel_size'] = st.slider("Kernel Size", 3, 15, 5, 2)
+                params['kernel_shape'] = st.selectbox("Kernel Shape", KERNEL_SHAPES)
+                params['kernel_size'] = st.slider("Kernel Size", 3, 201, 5, 2)
+                params['morphology_per_channel'] = st.checkbox(
+                    "Per Channel", help="Filter each color channel instead of the grayscale image")
             else:
+                params['kernel_shape'] = 'Square'
                 params['kernel_size'] = 5
+                params['morphology_per_channel'] = False
+            
+            # Remembered for the live stream on the webcam page
+            st.session_state.params = params
 
             st.markdown("---")
+
+            # Large images are edited on a downscaled proxy sized for the display
+            scale = preview_scale(image, settings.PREVIEW_MAX_SIDE)
+            use_preview = scale < 1.0 and st.checkbox(
+                "Fast Preview", value=True,
+                help="Adjust on a downscaled copy; downloads always use the full resolution")
+
             st.markdown("**Export Options**")
 
+            export_format = st.selectbox("Image Format", list(EXPORT_FORMATS))
+            export_lossless = False
+            if export_format == 'PNG':
+                export_quality = st.slider("PNG Compression", 0, 9, DEFAULT_PNG_COMPRESSION,
+                                           help="Higher levels give smaller files but encode slower")
+            else:
+                if export_format == 'WebP':
+                    export_lossless = st.checkbox("Lossless WebP")
+                export_quality = st.slider("Quality", 1, 100, DEFAULT_QUALITY,
+                                           disabled=export_lossless)
+
             if st.button("Download Processed Image", use_container_width=True):
-                st.session_state.download_processed = True
+                # Rendered and encoded in the background; the button below
+                # appears once the file is ready
+                key, future = request_export(image, params, export_format,
+                                             export_quality, export_lossless)
+                st.session_state.export_request = {'key': key, 'future': future,
+                                                   'format': export_format,
+                                                   'started': time.perf_counter()}
+            export_slot = st.empty()
 
             if st.button("Download Statistics", use_container_width=True):
                 st.session_state.download_stats = True
 
             if st.button("Load New Image", use_container_width=True):
-                st.session_state.image = None
+                clear_session_image()
                 if hasattr(st.session_state, 'image_source'):
                     del st.session_state.image_source
                 st.rerun()
 
-                   # Process the image
-            processed_image = apply_image_processing(image, params)
-            
-            # Calculate statistics
-            original_stats, original_gray = calculate_image_stats(image)
-            processed_stats, processed_gray = calculate_image_stats(processed_image)
+            with st.expander("Cache Statistics"):
+                st.dataframe(property_table(shared_cache.stats()),
+                             use_container_width=True, hide_index=True)
+                st.markdown("**Image Store**")
+                st.dataframe(property_table(shared_store.stats()),
+                             use_container_width=True, hide_index=True)
+                st.markdown("**Stream Buffer Pool**")
+                st.dataframe(property_table(st.session_state.buffer_pool.stats()),
+                             use_container_width=True, hide_index=True)
+
+            st.checkbox("Record Performance", key='record_performance',
+                        help="Time every stage, statistics pass, chart and export of each rerun")
+
+            # Process the image once per rerun; identical inputs are served from the shared cache
+            if use_preview:
+                display_image = make_preview(image, settings.PREVIEW_MAX_SIDE,
+                                             st.session_state.get('image_reduced'))
+                processed_image = process_image_cached(
+                    display_image, scale_params(params, display_image.shape[1] / image.shape[1]))
+            else:
+                display_image = image
+                processed_image = process_image_cached(image, params)
             
+            # Calculate statistics of the full image, sampled when it is large; the
+            # processed image only exists at preview size, so it is estimated from that
+            original_summary = calculate_image_stats_cached(image)
+            processed_summary = calculate_image_stats_cached(processed_image)
+            if use_preview:
+                processed_summary = preview_estimate(processed_summary, image.shape[1], image.shape[0])
             
 
-            # Handle downloads
-            if hasattr(st.session_state, 'download_processed') and st.session_state.download_processed:
-                processed_pil = Image.fromarray(processed_image.astype('uint8'))
-                buf = BytesIO()
-                processed_pil.save(buf, format='PNG')
-                st.download_button(
-                    label="Click to Download Processed Image",
-                    data=buf.getvalue(),
-                    file_name="processed_image.png",
-                    mime="image/png",
-                )
-                st.session_state.download_processed = False
+            # Handle downloads; exports are always rendered at full resolution
+            export_request = st.session_state.get('export_request')
+            if export_request is not None and export_request['key'] != export_key(
+                    image, params, export_format, export_quality, export_lossless):
+                # The image or the settings changed since the export was requested
+                export_request = st.session_state.export_request = None
+            if export_request is not None and export_request['future'].done():
+                error = export_request['future'].exception()
+                if error is not None:
+                    export_slot.error(f"Export failed: {error}")
+                else:
+                    data, records = export_request['future'].result()
+                    # The job ran on the export pool; count its spans once, in this session
+                    if not export_request.get('recorded'):
+                        export_request['recorded'] = True
+                        if recorder.memory_tracing:
+                            recorder.add_records(records)
+                    file_name, mime = export_file_name(export_request['format'])
+                    export_slot.download_button(
+                        label=f"Click to Download ({len(data) / 1024:,.0f} KB)",
+                        data=data,
+                        file_name=file_name,
+                        mime=mime,
+                        use_container_width=True,
+                    )
+            elif export_request is not None:
+                pending_export = (export_request, export_slot)
 
             if hasattr(st.session_state, 'download_stats') and st.session_state.download_stats:
-                all_stats = {**{f"Original_{k}": v for k, v in original_stats.items()},
-                           **{f"Processed_{k}": v for k, v in processed_stats.items()}}
-                stats_df = pd.DataFrame([all_stats])
-                csv = stats_df.to_csv(index=False)
+                # Always exact, whatever the size of the image
+                full_original_stats = calculate_image_stats_cached(
+                    image, approximate=False).as_dict()
+                full_processed_stats = calculate_image_stats_cached(
+                    render_full_resolution(image, params), approximate=False).as_dict()
+                all_stats = {**{f"Original_{k}": v for k, v in full_original_stats.items()},
+                           **{f"Processed_{k}": v for k, v in full_processed_stats.items()}}
+                with measure('export:csv', 'export'):
+                    buf = io.StringIO()
+                    writer = csv.DictWriter(buf, fieldnames=list(all_stats))
+                    writer.writeheader()
+                    writer.writerow(all_stats)
                 st.download_button(
                     label="Click to Download Statistics",
-                    data=csv,
+                    data=buf.getvalue(),
                     file_name="image_statistics.csv",
                     mime="text/csv",
                 )
                 st.session_state.download_stats = False
             
         with main_col:
-            # Process the image
-            processed_image = apply_image_processing(image, params)
-            
-            # Calculate statistics
-            original_stats, original_gray = calculate_image_stats(image)
-            processed_stats, processed_gray = calculate_image_stats(processed_image)
-            
+            if use_preview:
+                sampled = (f"{original_summary.sample_size:,} sampled pixels"
+                           if original_summary.approximate else "every pixel")
+                st.caption(f"Previewing at {display_image.shape[1]}x{display_image.shape[0]}; "
+                           f"downloads use the full {image.shape[1]}x{image.shape[0]} image. "
+                           f"Statistics describe the full image: the original's from {sampled}, "
+                           f"the processed image's estimated from the preview, with "
+                           f"{CONFIDENCE:.0%} confidence intervals under View Statistics. "
+                           f"Download Statistics computes them exactly.")
+            elif original_summary.approximate or processed_summary.approximate:
+                sampled = original_summary.sample_size or processed_summary.sample_size
+                st.caption(f"Statistics and charts are approximate: estimated from "
+                           f"{sampled:,} of {original_summary.total_pixels:,} pixels, with "
+                           f"{CONFIDENCE:.0%} confidence intervals under View Statistics. "
+                           f"Download Statistics computes them exactly.")
             
             # Display images
             img_col1, img_col2 = st.columns(2)
             
             with img_col1:
                 st.markdown("### Original Image")
-                st.image(image, use_column_width=True)
+                st.image(display_image, use_column_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
                 
                 with st.expander("View Statistics"):
-                    stats_df = pd.DataFrame(list(original_stats.items()), columns=['Property', 'Value'])
-                    st.dataframe(stats_df, use_container_width=True, hide_index=True)
+                    st.dataframe(statistics_table(original_summary), use_container_width=True,
+                                 hide_index=True)
             
             with img_col2:
                 st.markdown("### Processed Image")
@@ -480,113 +732,69 @@ elif st.session_state.page == 'main':
                 st.markdown('</div>', unsafe_allow_html=True)
                 
                 with st.expander("View Statistics"):
-                    processed_stats_df = pd.DataFrame(list(processed_stats.items()), columns=['Property', 'Value'])
-                    st.dataframe(processed_stats_df, use_container_width=True, hide_index=True)
+                    st.dataframe(statistics_table(processed_summary), use_container_width=True,
+                                 hide_index=True)
             
             st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
             
             # Analysis section
             st.markdown("### Image Analysis & Visualization")
             
-            tab1, tab2, tab3 = st.tabs(["Histogram Analysis", "Statistical Comparison", "Intensity Distribution"])
+            # Only the selected view is built and sent to the browser
+            view = st.radio("Analysis View", ANALYSIS_VIEWS, horizontal=True,
+                            key='analysis_view', label_visibility='collapsed')
             
-            with tab1:
-                original_hist = cv2.calcHist([original_gray], [0], None, [256], [0, 256])
-                processed_hist = cv2.calcHist([processed_gray], [0], None, [256], [0, 256])
-                
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(
-                    x=list(range(256)),
-                    y=original_hist.flatten(),
-                    mode='lines',
-                    name='Original',
-                    line=dict(color='#667eea', width=3),
-                    fill='tonexty'
-                ))
-                
-                fig.add_trace(go.Scatter(
-                    x=list(range(256)),
-                    y=processed_hist.flatten(),
-                    mode='lines',
-                    name='Processed',
-                    line=dict(color='#764ba2', width=3),
-                    fill='tonexty'
-                ))
-                
-                fig.update_layout(
-                    title='Pixel Intensity Histogram Comparison',
-                    xaxis_title='Pixel Intensity (0-255)',
-                    yaxis_title='Frequency',
-                    hovermode='x unified',
-                    height=500,
-                    showlegend=True
-                )
-                
-                st.plotly_chart(fig, use_container_width=True)
+            if view == "Histogram Analysis":
+                with measure('chart:histogram', 'chart'):
+                    st.plotly_chart(histogram_figure(original_summary, processed_summary),
+                                    use_container_width=True)
             
-            with tab2:
+            elif view == "Statistical Comparison":
                 chart_col1, chart_col2 = st.columns(2)
                 
-                with chart_col1:
-                    brightness_data = {
-                        'Metric': ['Mean', 'Standard Deviation', 'Minimum', 'Maximum'],
-                        'Original': [original_stats['Mean Brightness'], original_stats['Std Brightness'], 
-                                   original_stats['Min Intensity'], original_stats['Max Intensity']],
-                        'Processed': [processed_stats['Mean Brightness'], processed_stats['Std Brightness'],
-                                    processed_stats['Min Intensity'], processed_stats['Max Intensity']]
-                    }
-                    
-                    brightness_df = pd.DataFrame(brightness_data)
-                    fig_brightness = px.bar(brightness_df, x='Metric', y=['Original', 'Processed'],
-                                          title='Intensity Statistics Comparison',
-                                          barmode='group',
-                                          color_discrete_sequence=['#667eea', '#764ba2'])
-                    fig_brightness.update_layout(height=400)
-                    st.plotly_chart(fig_brightness, use_container_width=True)
+                with chart_col1, measure('chart:statistics', 'chart'):
+                    st.plotly_chart(statistics_figure(original_summary, processed_summary),
+                                    use_container_width=True)
                 
-                with chart_col2:
-                    props_data = {
-                        'Property': ['Width', 'Height', 'Total Pixels'],
-                        'Value': [original_stats['Width'], original_stats['Height'], original_stats['Total Pixels']]
-                    }
-                    
-                    fig_props = px.pie(values=props_data['Value'], names=props_data['Property'],
-                                     title='Image Properties',
-                                     color_discrete_sequence=px.colors.sequential.Blues_r)
-                    fig_props.update_layout(height=400)
-                    st.plotly_chart(fig_props, use_container_width=True)
+                with chart_col2, measure('chart:properties', 'chart'):
+                    st.plotly_chart(properties_figure(original_summary), use_container_width=True)
             
-            with tab3:
+            else:
                 dist_col1, dist_col2 = st.columns(2)
                 
-                with dist_col1:
-                    intensity_ranges = ['Very Dark (0-63)', 'Dark (64-127)', 'Bright (128-191)', 'Very Bright (192-255)']
-                    original_ranges = [
-                        np.sum((original_gray >= 0) & (original_gray < 64)),
-                        np.sum((original_gray >= 64) & (original_gray < 128)),
-                        np.sum((original_gray >= 128) & (original_gray < 192)),
-                        np.sum((original_gray >= 192) & (original_gray <= 255))
-                    ]
-                    
-                    fig_pie_orig = px.pie(values=original_ranges, names=intensity_ranges,
-                                        title='Original Image Intensity Distribution',
-                                        color_discrete_sequence=['#1f4e79', '#2e6ba8', '#4a90d9', '#87ceeb'])
-                    fig_pie_orig.update_layout(height=400)
-                    st.plotly_chart(fig_pie_orig, use_container_width=True)
+                with dist_col1, measure('chart:original_distribution', 'chart'):
+                    st.plotly_chart(distribution_figure(original_summary, 'Original'),
+                                    use_container_width=True)
+                    if original_summary.approximate:
+                        st.dataframe(range_table(original_summary), use_container_width=True,
+                                     hide_index=True)
                 
-                with dist_col2:
-                    processed_ranges = [
-                        np.sum((processed_gray >= 0) & (processed_gray < 64)),
-                        np.sum((processed_gray >= 64) & (processed_gray < 128)),
-                        np.sum((processed_gray >= 128) & (processed_gray < 192)),
-                        np.sum((processed_gray >= 192) & (processed_gray <= 255))
-                    ]
+                with dist_col2, measure('chart:processed_distribution', 'chart'):
+                    st.plotly_chart(distribution_figure(processed_summary, 'Processed'),
+                                    use_container_width=True)
+                    if processed_summary.approximate:
+                        st.dataframe(range_table(processed_summary), use_container_width=True,
+                                     hide_index=True)
+            
+            if recorder.memory_tracing:
+                with st.expander("Performance", expanded=True):
+                    last_run = [{'name': r['name'], 'category': r['category'],
+                                 'ms': r['seconds'] * 1000,
+                                 'peak MB': None if r['peak_bytes'] is None else r['peak_bytes'] / 1e6}
+                                for r in recorder.last_run()]
+                    st.markdown("**Last completed rerun**")
+                    st.dataframe(last_run, use_container_width=True, hide_index=True)
+                    
+                    st.markdown(f"**All recorded reruns** ({len(recorder.records)} records)")
+                    st.dataframe(recorder.summary(), use_container_width=True, hide_index=True)
                     
-                    fig_pie_proc = px.pie(values=processed_ranges, names=intensity_ranges,
-                                        title='Processed Image Intensity Distribution',
-                                        color_discrete_sequence=['#7b2d26', '#a73c2a', '#d64933', '#ff6b47'])
-                    fig_pie_proc.update_layout(height=400)
-                    st.plotly_chart(fig_pie_proc, use_container_width=True)
+                    export_col1, export_col2 = st.columns(2)
+                    with export_col1:
+                        st.download_button("Download CSV", recorder.to_csv(),
+                                           file_name="performance.csv", mime="text/csv")
+                    with export_col2:
+                        st.download_button("Download JSON", recorder.to_json(),
+                                           file_name="performance.json", mime="application/json")
             
     else:
         # Welcome screen
@@ -598,4 +806,18 @@ elif st.session_state.page == 'main':
             </p>
             <p>Choose an image source above to begin processing</p>
         </div>
-        """, unsafe_allow_html=True)
\ No newline at end of file
+        """, unsafe_allow_html=True)
+
+if recorder.memory_tracing:
+    recorder.end_run()
+
+# Wait for a background export only once the page is fully drawn. Updating the
+# placeholder lets Streamlit stop this loop as soon as a widget changes, so
+# the sliders stay responsive while the file is being encoded.
+if pending_export is not None:
+    export_request, export_slot = pending_export
+    while not export_request['future'].done():
+        elapsed = time.perf_counter() - export_request['started']
+        export_slot.info(f"Encoding {export_request['format']} export... {elapsed:.0f} s")
+        time.sleep(0.25)
+    st.rerun()
@@ -0,0 +1,66 @@
+"""Image loading flows of the app, run through Streamlit's AppTest"""
+import os
+from io import BytesIO
+from unittest import mock
+
+import pytest
+import streamlit as st
+from PIL import Image
+
+from samples import generate_sample
+
+testing = pytest.importorskip('streamlit.testing.v1')
+
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'streamlit_image_app.py')
+
+
+def _upload(name):
+    buf = BytesIO()
+    Image.fromarray(generate_sample('Geometric Shapes', (320, 240))).save(buf, format='PNG')
+    buf.seek(0)
+    buf.name = name
+    return buf
+
+
+def _click(app, label):
+    next(b for b in app.button if b.label == label).click().run()
+
+
+def _loaded(app):
+    return any(s.value == "Image loaded successfully!" for s in app.success)
+
+
+def test_same_file_loads_again_after_load_new_image():
+    app = testing.AppTest.from_file(APP_FILE, default_timeout=120)
+    app.run()
+    upload = _upload('a.png')
+    # AppTest of Streamlit 1.28 does not carry out st.rerun(); the next run() does
+    with mock.patch.object(st, 'file_uploader', lambda *args, **kwargs: upload), \
+            mock.patch.object(st, 'rerun', lambda: None):
+        _click(app, "Upload File")
+        assert not app.exception and _loaded(app)
+
+        _click(app, "Load New Image")
+        app.run()
+        assert not _loaded(app)
+        _click(app, "Upload File")
+        assert not app.exception and _loaded(app)
+
+
+def test_background_export_shows_in_the_performance_panel():
+    app = testing.AppTest.from_file(APP_FILE, default_timeout=120)
+    app.run()
+    with mock.patch.object(st, 'rerun', lambda: None):
+        _click(app, "Sample Images")
+        _click(app, "Load Selected Sample")
+        next(c for c in app.checkbox if c.label == "Record Performance").check().run()
+        # The rerun that requests the export waits for it before finishing
+        _click(app, "Download Processed Image")
+        app.run()
+        # Later reruns still show the download but do not count the job again
+        app.run()
+    assert not app.exception
+    assert any(b.proto.label.startswith("Click to Download") for b in app.get('download_button'))
+    names = [r['name'] for r in app.session_state.perf_recorder.records]
+    assert names.count('export:png') == 1 and 'export' in names
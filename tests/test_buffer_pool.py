@@ -0,0 +1,60 @@
+"""Buffer reuse of the pooled pipeline and the byte limit of the pool"""
+import numpy as np
+from PIL import Image
+
+import batch_process
+from buffer_pool import BufferPool
+from image_processing import DEFAULT_PARAMS, apply_image_processing
+from samples import generate_sample
+
+PARAMS = {**DEFAULT_PARAMS, 'grayscale': True, 'blur': 3, 'brightness': 20, 'edge_detection': True}
+
+
+def test_steady_state_rerun_allocates_nothing():
+    pool = BufferPool()
+    image = generate_sample('Geometric Shapes', (320, 240))
+    pool.release(apply_image_processing(image, PARAMS, pool))
+    allocations = pool.allocations
+
+    for _ in range(3):
+        pool.release(apply_image_processing(image, PARAMS, pool))
+    assert pool.allocations == allocations
+    assert pool.reuses > 0
+
+
+def test_free_buffers_stay_within_the_limit():
+    sides = range(100, 400, 20)
+    # Room for the buffers of the largest image only
+    largest = BufferPool()
+    largest.release(apply_image_processing(generate_sample('Color Gradient', (sides[-1],) * 2),
+                                           PARAMS, largest))
+    limit = largest.stats()['Free Bytes']
+
+    pool = BufferPool(limit)
+    for side in sides:
+        image = generate_sample('Color Gradient', (side, side))
+        pool.release(apply_image_processing(image, PARAMS, pool))
+        assert pool.stats()['Free Bytes'] <= limit
+    # The most recent shape is kept, so repeating it still allocates nothing
+    allocations = pool.allocations
+    pool.release(apply_image_processing(image, PARAMS, pool))
+    assert pool.allocations == allocations
+
+
+def test_least_recently_used_shape_goes_first():
+    pool = BufferPool(250)
+    old, new = np.empty(100, np.uint8), np.empty(100, np.uint16)
+    pool.release(old)
+    pool.release(new)
+    assert pool.acquire((100,), np.uint16) is new
+    assert pool.stats()['Free Buffers'] == 0
+
+
+def test_batch_worker_reuses_buffers(tmp_path):
+    path = tmp_path / 'input.png'
+    Image.fromarray(generate_sample('Portrait Style', (320, 240))).save(path)
+    batch_process.process_file(str(path), PARAMS, str(tmp_path))
+    allocations = batch_process._pool.allocations
+
+    batch_process.process_file(str(path), PARAMS, str(tmp_path))
+    assert batch_process._pool.allocations == allocations
@@ -0,0 +1,29 @@
+"""Normalization of decoded images to 8-bit RGB"""
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from image_decode import decode_image
+
+
+def _png(pil_image):
+    buf = BytesIO()
+    pil_image.save(buf, format='PNG')
+    buf.seek(0)
+    return buf
+
+
+def test_16_bit_gray_is_scaled_not_clipped():
+    ramp = np.linspace(0, 65535, 256 * 4, dtype=np.uint16).reshape(4, 256)
+    decoded = decode_image(_png(Image.fromarray(ramp)))
+    assert decoded.shape == (4, 256, 3) and decoded.dtype == np.uint8
+    np.testing.assert_array_equal(decoded[..., 0], ramp >> 8)
+    np.testing.assert_array_equal(decoded[..., 0], decoded[..., 2])
+
+
+def test_8_bit_inputs_are_unchanged():
+    rgb = np.random.default_rng(0).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    np.testing.assert_array_equal(decode_image(_png(Image.fromarray(rgb))), rgb)
+    gray = rgb[..., 0]
+    np.testing.assert_array_equal(decode_image(_png(Image.fromarray(gray)))[..., 1], gray)
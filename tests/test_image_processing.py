@@ -0,0 +1,119 @@
+"""The staged pipeline against a frozen copy of the original per-pixel one"""
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+from image_processing import DEFAULT_PARAMS, _tone, apply_image_processing, tone_lut
+from samples import SAMPLE_NAMES, generate_sample
+
+BRIGHTNESS_VALUES = range(-100, 101)
+CONTRAST_VALUES = [round(0.1 * step, 1) for step in range(1, 31)]
+
+
+def baseline_apply_image_processing(image, params):
+    """apply_image_processing as it was before the pipeline was reworked"""
+    processed = image.copy()
+
+    if params['grayscale']:
+        if len(processed.shape) == 3:
+            processed = cv2.cvtColor(processed, cv2.COLOR_RGB2GRAY)
+            processed = cv2.cvtColor(processed, cv2.COLOR_GRAY2RGB)
+
+    if params['blur'] > 0:
+        ksize = int(params['blur']) * 2 + 1
+        processed = cv2.GaussianBlur(processed, (ksize, ksize), 0)
+
+    if params['brightness'] != 0:
+        processed = cv2.convertScaleAbs(processed, beta=params['brightness'])
+
+    if params['contrast'] != 1.0:
+        processed = cv2.convertScaleAbs(processed, alpha=params['contrast'])
+
+    if params['edge_detection']:
+        if len(processed.shape) == 3:
+            gray = cv2.cvtColor(processed, cv2.COLOR_RGB2GRAY)
+        else:
+            gray = processed
+        edges = cv2.Canny(gray, params['canny_low'], params['canny_high'])
+        processed = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
+
+    if params['morphology'] != 'None':
+        if len(processed.shape) == 3:
+            gray = cv2.cvtColor(processed, cv2.COLOR_RGB2GRAY)
+        else:
+            gray = processed
+
+        kernel = np.ones((params['kernel_size'], params['kernel_size']), np.uint8)
+
+        if params['morphology'] == 'Erosion':
+            gray = cv2.erode(gray, kernel, iterations=1)
+        elif params['morphology'] == 'Dilation':
+            gray = cv2.dilate(gray, kernel, iterations=1)
+        elif params['morphology'] == 'Opening':
+            gray = cv2.morphologyEx(gray, cv2.MORPH_OPEN, kernel)
+        elif params['morphology'] == 'Closing':
+            gray = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
+
+        processed = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+
+    return processed
+
+
+@pytest.fixture(scope='module')
+def images():
+    return [generate_sample(name, (160, 120)) for name in SAMPLE_NAMES]
+
+
+def _params(**overrides):
+    return {**DEFAULT_PARAMS, **overrides}
+
+
+def test_tone_lut_matches_every_slider_value():
+    # Every pixel value in every channel, so the LUT is checked entry by entry
+    ramp = np.repeat(np.arange(256, dtype=np.uint8).reshape(1, 256, 1), 3, axis=2)
+    for brightness in BRIGHTNESS_VALUES:
+        for contrast in CONTRAST_VALUES:
+            params = _params(brightness=brightness, contrast=contrast)
+            expected = baseline_apply_image_processing(ramp, params)
+            np.testing.assert_array_equal(cv2.LUT(ramp, tone_lut(brightness, contrast)), expected,
+                                          err_msg=f"brightness={brightness} contrast={contrast}")
+
+
+def test_tone_stage_matches_on_images(images):
+    for brightness in range(-100, 101, 10):
+        for contrast in CONTRAST_VALUES:
+            params = _params(brightness=brightness, contrast=contrast)
+            for image in images:
+                np.testing.assert_array_equal(_tone(image, params),
+                                              baseline_apply_image_processing(image, params))
+
+
+def test_grayscale_then_tone(images):
+    for brightness in range(-100, 101, 5):
+        for contrast in CONTRAST_VALUES:
+            params = _params(grayscale=True, brightness=brightness, contrast=contrast)
+            for image in images:
+                np.testing.assert_array_equal(apply_image_processing(image, params),
+                                              baseline_apply_image_processing(image, params))
+
+
+def test_full_pipeline_random_params(images):
+    rng = random.Random(0)
+    for _ in range(300):
+        params = _params(
+            grayscale=rng.random() < 0.5,
+            blur=rng.randint(0, 10),
+            brightness=rng.choice([0, rng.randint(-100, 100)]),
+            contrast=rng.choice([1.0, rng.choice(CONTRAST_VALUES)]),
+            edge_detection=rng.random() < 0.3,
+            canny_low=rng.randint(0, 255),
+            canny_high=rng.randint(0, 255),
+            morphology=rng.choice(['None', 'Erosion', 'Dilation', 'Opening', 'Closing']),
+            kernel_size=rng.randrange(3, 32, 2),
+        )
+        image = rng.choice(images)
+        np.testing.assert_array_equal(apply_image_processing(image, params),
+                                      baseline_apply_image_processing(image, params),
+                                      err_msg=str(params))
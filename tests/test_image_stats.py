@@ -0,0 +1,40 @@
+"""Sampled statistics of large images and estimates from the preview"""
+import numpy as np
+
+import settings
+from image_processing import make_preview
+from image_stats import calculate_image_stats, calculate_image_stats_cached, preview_estimate
+from samples import generate_sample
+
+
+def test_threshold_applies_to_the_image_given(monkeypatch):
+    monkeypatch.setattr(settings, 'APPROX_STATS_MIN_PIXELS', 600 * 400)
+    monkeypatch.setattr(settings, 'APPROX_STATS_SAMPLE_PIXELS', 10_000)
+    image = generate_sample('Geometric Shapes', (600, 400))
+    preview = make_preview(image, 300)
+
+    full = calculate_image_stats_cached(image)
+    assert full.approximate
+    assert (full.width, full.height, full.total_pixels) == (600, 400, 240_000)
+    assert full.sample_size <= 10_000
+    assert not calculate_image_stats_cached(preview).approximate
+
+
+def test_sampled_estimate_covers_the_exact_value():
+    image = generate_sample('Portrait Style', (800, 600))
+    exact = calculate_image_stats(image)
+    sampled = calculate_image_stats(image, sample_size=20_000)
+    low, high = sampled.intervals()['Mean Brightness']
+    assert low <= exact.mean <= high
+    assert abs(int(sampled.counts.sum()) - exact.total_pixels) < 256
+
+
+def test_preview_estimate_has_the_full_size():
+    image = generate_sample('Color Gradient', (1200, 800))
+    preview = make_preview(image, 300)
+    estimate = preview_estimate(calculate_image_stats(preview), 1200, 800)
+    assert estimate.approximate
+    assert estimate.sample_size == preview.shape[0] * preview.shape[1]
+    assert estimate.as_dict()['Total Pixels'] == 960_000
+    assert abs(estimate.mean - calculate_image_stats(image).mean) < 1.0
+    assert np.isclose(estimate.counts.sum(), 960_000, atol=256)
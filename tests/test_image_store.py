@@ -0,0 +1,109 @@
+"""Deduplication, reference counting, spill and caps of the image store"""
+import gc
+
+import numpy as np
+import pytest
+
+from image_store import ImageLimitError, ImageStore
+from result_cache import ResultCache, freeze
+
+MB = 1024 * 1024
+
+
+def _image(value, side=100):
+    return freeze(np.full((side, side, 3), value, np.uint8))
+
+
+@pytest.fixture
+def cache():
+    return ResultCache(100 * MB)
+
+
+@pytest.fixture
+def store(tmp_path, cache):
+    return ImageStore(max_bytes=MB, session_max_bytes=MB, spill_dir=str(tmp_path), cache=cache)
+
+
+def test_stored_image_is_served_for_its_cache_key(store, cache):
+    computed = []
+
+    def load():
+        computed.append(1)
+        return _image(7)
+
+    image = cache.get_or_compute(('sample', 'flat', 7), load)
+    handle = store.put(image, 'a')
+    assert cache.stats()['Entries'] == 0
+
+    # Neither the cache nor the computation holds a second copy
+    assert cache.get_or_compute(('sample', 'flat', 7), load) is image
+    assert computed == [1]
+
+    handle.release()
+    assert cache.get_or_compute(('sample', 'flat', 7), load) is not image
+    assert computed == [1, 1]
+
+
+def test_tuple_values_are_rebuilt_around_the_stored_image(store, cache):
+    reduced = _image(7, side=10)
+    full, _ = cache.get_or_compute(('decoded', 'digest', 1280), lambda: (_image(7), reduced))
+    handle = store.put(full, 'a')
+    value = cache.get_or_compute(('decoded', 'digest', 1280), lambda: pytest.fail("decoded again"))
+    assert value[0] is full and value[1] is reduced
+    del handle
+
+
+def test_identical_images_are_stored_once(store):
+    first = store.put(_image(1), 'a')
+    second = store.put(np.full((100, 100, 3), 1, np.uint8), 'b')
+    assert first.key == second.key
+    assert store.stats()['Images'] == 1
+    assert store.stats()['Deduplicated Loads'] == 1
+
+
+def test_collected_handles_release_the_image(store):
+    handle = store.put(_image(2), 'a')
+    other = store.put(_image(2), 'b')
+    del handle
+    gc.collect()
+    assert store.stats()['Images'] == 1 and store.owner_bytes('a') == 0
+    del other
+    gc.collect()
+    assert store.stats()['Images'] == 0 and store.stats()['Resident Bytes'] == 0
+
+
+def test_images_past_the_ceiling_spill_and_reload(tmp_path, cache):
+    image_bytes = _image(0).nbytes
+    store = ImageStore(max_bytes=2 * image_bytes, session_max_bytes=10 * MB,
+                       spill_dir=str(tmp_path), cache=cache)
+    handles = [store.put(_image(value), 'a') for value in range(4)]
+    stats = store.stats()
+    assert stats['Resident Bytes'] <= 2 * image_bytes
+    assert stats['Spilled Images'] == 2 and stats['Spills'] == 2
+
+    # The least recently used came back from disk with the same pixels
+    reloaded = handles[0].get()
+    assert store.stats()['Reloads'] == 1
+    assert not reloaded.flags.writeable
+    np.testing.assert_array_equal(reloaded, _image(0))
+    assert store.stats()['Resident Bytes'] <= 2 * image_bytes
+
+    spill_files = list(tmp_path.rglob('*.npy'))
+    assert spill_files
+    del handles, reloaded
+    gc.collect()
+    assert not list(tmp_path.rglob('*.npy'))
+
+
+def test_session_cap(tmp_path, cache):
+    image_bytes = _image(0).nbytes
+    store = ImageStore(max_bytes=10 * MB, session_max_bytes=2 * image_bytes,
+                       spill_dir=str(tmp_path), cache=cache)
+    kept = [store.put(_image(value), 'a') for value in range(2)]
+    with pytest.raises(ImageLimitError):
+        store.put(_image(9), 'a')
+    # Another session has its own allowance, and an image already held is free
+    other = store.put(_image(9), 'b')
+    again = store.put(_image(0), 'a')
+    assert store.owner_bytes('a') == 2 * image_bytes
+    del kept, other, again
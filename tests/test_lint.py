@@ -0,0 +1,19 @@
+"""Static check of the modules: no unused imports or undefined names"""
+import glob
+import io
+import os
+
+import pytest
+
+pyflakes_api = pytest.importorskip('pyflakes.api')
+pyflakes_reporter = pytest.importorskip('pyflakes.reporter')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_pyflakes_is_clean():
+    output = io.StringIO()
+    paths = sorted(glob.glob(os.path.join(ROOT, '*.py'))
+                   + glob.glob(os.path.join(ROOT, 'tests', '*.py')))
+    warnings = sum(pyflakes_api.checkPath(path, pyflakes_reporter.Reporter(output, output)) for path in paths)
+    assert warnings == 0, output.getvalue()
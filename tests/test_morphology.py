@@ -0,0 +1,57 @@
+"""Decomposed morphology against OpenCV's own filters"""
+import cv2
+import numpy as np
+import pytest
+
+import morphology
+from morphology import KERNEL_SHAPES, morphology as apply_morphology, structuring_element
+
+OPERATIONS = {
+    'Erosion': cv2.MORPH_ERODE,
+    'Dilation': cv2.MORPH_DILATE,
+    'Opening': cv2.MORPH_OPEN,
+    'Closing': cv2.MORPH_CLOSE,
+}
+SIZES = (31, 33, 125, 127, 129, 201)
+
+
+@pytest.fixture(scope='module')
+def images():
+    rng = np.random.default_rng(17)
+    # Sparse bright spots on a noisy background, smaller than the largest
+    # kernels so that every window reaches a border
+    color = rng.integers(0, 160, (150, 170, 3), dtype=np.uint8)
+    spots = rng.random(color.shape[:2]) < 0.002
+    color[spots] = 255
+    return {'gray': cv2.cvtColor(color, cv2.COLOR_RGB2GRAY), 'rgb': color}
+
+
+@pytest.fixture(params=['default', 'vhgw'])
+def thresholds(request, monkeypatch):
+    # Either the shipped switch-over points or van Herk/Gil-Werman for every line
+    if request.param == 'vhgw':
+        monkeypatch.setattr(morphology, 'VHGW_MIN_HORIZONTAL', 3)
+        monkeypatch.setattr(morphology, 'VHGW_MIN_VERTICAL', 3)
+        monkeypatch.setattr(morphology, 'DIRECT_MAX_SIZE', 1)
+    return request.param
+
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('shape', KERNEL_SHAPES)
+@pytest.mark.parametrize('operation', OPERATIONS)
+@pytest.mark.parametrize('kind', ['gray', 'rgb'])
+def test_matches_opencv(images, thresholds, kind, operation, shape, size):
+    image = images[kind]
+    expected = cv2.morphologyEx(image, OPERATIONS[operation], structuring_element(shape, size))
+    result = apply_morphology(image, operation, size, shape)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_dst_is_filled_and_input_untouched(images):
+    image = images['rgb']
+    original = image.copy()
+    dst = np.empty_like(image)
+    assert apply_morphology(image, 'Closing', 201, 'Square', dst=dst) is dst
+    np.testing.assert_array_equal(
+        dst, cv2.morphologyEx(image, cv2.MORPH_CLOSE, structuring_element('Square', 201)))
+    np.testing.assert_array_equal(image, original)
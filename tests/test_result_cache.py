@@ -0,0 +1,32 @@
+"""Hit and miss accounting of the shared result cache"""
+from image_processing import DEFAULT_PARAMS, process_image_cached
+from result_cache import ResultCache, shared_cache
+from samples import generate_sample
+
+
+def _counts():
+    stats = shared_cache.stats()
+    return stats['Hits'], stats['Misses']
+
+
+def test_one_lookup_per_pipeline_request():
+    image = generate_sample('Random Noise', (96, 64), seed=11)
+    params = {**DEFAULT_PARAMS, 'blur': 2, 'brightness': 10, 'edge_detection': True}
+
+    hits, misses = _counts()
+    process_image_cached(image, params)
+    assert _counts() == (hits, misses + 1)
+    # A later stage changed: resumes from the cached prefix, one hit
+    process_image_cached(image, {**params, 'canny_low': 10})
+    assert _counts() == (hits + 1, misses + 1)
+    process_image_cached(image, params)
+    assert _counts() == (hits + 2, misses + 1)
+
+
+def test_get_last_returns_the_longest_cached_prefix():
+    cache = ResultCache(1024)
+    cache.put('a', b'1')
+    cache.put('b', b'22')
+    assert cache.get_last(['a', 'b', 'c']) == (1, b'22')
+    assert cache.get_last(['x', 'y']) == (-1, None)
+    assert (cache.hits, cache.misses) == (1, 1)
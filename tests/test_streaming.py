@@ -0,0 +1,65 @@
+"""Live stream loop: processed, overwritten and late frames, and shutdown"""
+import time
+
+from buffer_pool import BufferPool
+from image_processing import DEFAULT_PARAMS
+from streaming import SyntheticSource, run_stream
+
+PARAMS = {**DEFAULT_PARAMS, 'blur': 3, 'edge_detection': True}
+
+
+class TrackedSource(SyntheticSource):
+    """Synthetic source that remembers whether it was released mid-read"""
+
+    def __init__(self, read_delay=0.0, **kwargs):
+        super().__init__(width=160, height=120, **kwargs)
+        self.read_delay = read_delay
+        self.reading = False
+        self.released_while_reading = None
+
+    def read(self):
+        self.reading = True
+        try:
+            time.sleep(self.read_delay)
+            return super().read()
+        finally:
+            self.reading = False
+
+    def release(self):
+        self.released_while_reading = self.reading
+
+
+def test_frames_are_processed_and_the_grabber_stops():
+    source = TrackedSource(fps=200)
+    pool = BufferPool()
+    grabbers = []
+
+    def on_frame(frame, processed, stats, grabber):
+        grabbers.append(grabber)
+        assert processed.shape[:2] == frame.shape[:2]
+        # Slower than the source, so newer frames replace unread ones
+        time.sleep(0.03)
+
+    stats = run_stream(source, PARAMS, 1.0, on_frame, max_frames=5, pool=pool)
+    assert stats.processed == 5
+    assert stats.mean_latency > 0
+    grabber = grabbers[-1]
+    assert grabber.overwritten > 0
+    assert grabber.captured >= 5 + grabber.overwritten
+    assert not grabber._thread.is_alive()
+    assert source.released_while_reading is False
+    assert pool.reuses > 0
+
+
+def test_frames_older_than_the_budget_are_dropped():
+    stats = run_stream(TrackedSource(fps=100), PARAMS, 0.0, lambda *args: None, max_seconds=0.2)
+    assert stats.processed == 0
+    assert stats.dropped_late > 0
+
+
+def test_source_is_released_after_a_slow_read():
+    # The loop ends while the reader is still inside read()
+    source = TrackedSource(read_delay=0.3, fps=100)
+    stats = run_stream(source, PARAMS, 1.0, lambda *args: False)
+    assert stats.processed == 1
+    assert source.released_while_reading is False
@@ -0,0 +1,113 @@
+"""Banded, parallel and full-resolution renders against the plain pipeline"""
+import threading
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import batch_process
+import settings
+from image_processing import DEFAULT_PARAMS, apply_image_processing
+from samples import generate_sample
+from tiled_processing import (apply_image_processing_parallel, apply_image_processing_tiled,
+                              limit_cv2_threads, render_full_resolution)
+
+PARAMS = {**DEFAULT_PARAMS, 'blur': 2, 'contrast': 1.4, 'edge_detection': True}
+
+# Local stages only, Canny on its own and morphology on either side of Canny
+PIPELINES = {
+    'local': {**DEFAULT_PARAMS, 'blur': 3, 'brightness': 30, 'contrast': 1.3},
+    'canny': {**DEFAULT_PARAMS, 'grayscale': True, 'blur': 1, 'edge_detection': True,
+              'canny_low': 30, 'canny_high': 90},
+    'opening': {**DEFAULT_PARAMS, 'blur': 2, 'morphology': 'Opening', 'kernel_size': 9,
+                'kernel_shape': 'Ellipse', 'morphology_per_channel': True},
+    'canny+closing': {**DEFAULT_PARAMS, 'edge_detection': True, 'morphology': 'Closing',
+                      'kernel_size': 7, 'kernel_shape': 'Cross'},
+}
+
+
+@pytest.fixture(scope='module', params=['Geometric Shapes', 'Random Noise'])
+def image(request):
+    # Noise gives Canny long chains of weak edges that cross many bands
+    return generate_sample(request.param, (300, 211))
+
+
+@pytest.fixture
+def cv2_threads():
+    saved = cv2.getNumThreads()
+    cv2.setNumThreads(3)
+    yield 3
+    cv2.setNumThreads(saved)
+
+
+@pytest.mark.parametrize('name', PIPELINES)
+@pytest.mark.parametrize('workers', [1, 2, 3, 5])
+def test_parallel_matches_the_pipeline(image, name, workers):
+    params = PIPELINES[name]
+    np.testing.assert_array_equal(apply_image_processing_parallel(image, params, workers=workers),
+                                  apply_image_processing(image, params))
+
+
+@pytest.mark.parametrize('name', PIPELINES)
+@pytest.mark.parametrize('band_bytes, workers', [(8 * 1024, 1), (8 * 1024, 3), (50 * 1024, 2),
+                                                 (10 ** 9, 1)])
+def test_bands_match_the_pipeline(image, name, band_bytes, workers):
+    # 8 KB is a band of two or three rows, so nearly every row is at a border
+    params = PIPELINES[name]
+    np.testing.assert_array_equal(
+        apply_image_processing_tiled(image, params, band_bytes=band_bytes, workers=workers),
+        apply_image_processing(image, params))
+
+
+def test_nested_limits_restore_the_thread_count(cv2_threads):
+    with limit_cv2_threads(4):
+        limited = cv2.getNumThreads()
+        with limit_cv2_threads(2):
+            assert cv2.getNumThreads() == limited
+        assert cv2.getNumThreads() == limited
+    assert cv2.getNumThreads() == cv2_threads
+
+
+def test_concurrent_pools_restore_the_thread_count(cv2_threads, image):
+    barrier = threading.Barrier(3)
+    errors = []
+
+    def hold(workers):
+        # All three pools overlap, then leave in a different order
+        try:
+            with limit_cv2_threads(workers):
+                barrier.wait(timeout=5)
+                apply_image_processing_parallel(image, PIPELINES['canny'], workers=workers)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=hold, args=(workers,)) for workers in (2, 3, 4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert cv2.getNumThreads() == cv2_threads
+
+
+def test_large_render_is_memory_mapped(monkeypatch):
+    monkeypatch.setattr(settings, 'TILED_MIN_PIXELS', 1)
+    monkeypatch.setattr(settings, 'TILE_BAND_BYTES', 64 * 1024)
+    image = generate_sample('Random Noise', (300, 200), seed=6)
+    rendered = render_full_resolution(image, PARAMS)
+    assert isinstance(rendered, np.memmap)
+    np.testing.assert_array_equal(rendered, apply_image_processing(image, PARAMS))
+
+
+def test_batch_item_above_the_tiled_size(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'TILED_MIN_PIXELS', 1)
+    image = generate_sample('Geometric Shapes', (300, 200))
+    path = tmp_path / 'input.png'
+    Image.fromarray(image).save(path)
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    row = batch_process.process_file(str(path), PARAMS, str(out_dir))
+    written = np.array(Image.open(out_dir / 'input.png'))
+    np.testing.assert_array_equal(written, apply_image_processing(image, PARAMS))
+    assert row['Processed_Total Pixels'] == 300 * 200
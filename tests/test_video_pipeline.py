@@ -0,0 +1,38 @@
+"""Frame-parallel video processing, including an early stop"""
+import cv2
+import numpy as np
+import pytest
+
+from image_processing import DEFAULT_PARAMS
+from video_pipeline import process_video
+
+PARAMS = {**DEFAULT_PARAMS, 'blur': 1, 'edge_detection': True}
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / 'input.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (64, 48))
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        writer.write(rng.integers(0, 256, (48, 64, 3), dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_every_frame_is_written(video, tmp_path):
+    frames, _ = process_video(video, str(tmp_path / 'out.avi'), PARAMS, workers=2,
+                              fourcc='MJPG', stats_csv=str(tmp_path / 'frames.csv'))
+    assert frames == 30
+    with open(tmp_path / 'frames.csv') as f:
+        assert len(f.readlines()) == 31
+
+
+def test_early_stop_releases_the_capture(video, tmp_path):
+    def progress(done, total):
+        if done == 3:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        process_video(video, str(tmp_path / 'out.avi'), PARAMS, workers=2, max_in_flight=1,
+                      fourcc='MJPG', progress=progress)
@@ -0,0 +1,331 @@
+"""Band-wise execution of the processing pipeline for very large images
+
+The image is processed in horizontal bands of full rows that are read from
+(and written to) ordinary arrays or memory-mapped ``.npy`` files, so the
+working memory is bounded by the band size rather than the image size.
+
+Each band is read with a halo of extra rows equal to the combined radius of
+the stages applied to it and the halo is cropped afterwards, which makes the
+stitched result identical to ``apply_image_processing``. Canny is the one
+stage that is not local: its hysteresis follows weak edges arbitrarily far.
+It is therefore split in two. Per band, ``Canny(low, low)`` yields the pixels
+that survive non-maximum suppression above the low threshold and
+``Canny(high, high)`` the strong ones; the final edges are the 8-connected
+components of the former that contain a pixel of the latter. Components are
+labelled per band, joined across band boundaries with a union-find over the
+touching rows, and written out in a last band pass.
+
+Bands are independent, so they can also be processed by a thread pool: cv2
+releases the GIL, and while a pool is active OpenCV's own thread count is
+lowered so that the two levels of threading do not oversubscribe the cores.
+"""
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+import settings
+from buffer_pool import BufferPool
+from perf import measure
+from image_processing import (execution_plan, output_shape, pipeline_key, process_image_cached,
+                              stages_output_shape)
+from result_cache import shared_cache
+
+# Extra rows Canny needs around a pixel: 3x3 Sobel plus non-maximum suppression
+CANNY_RADIUS = 2
+
+
+# Reference count of running thread pools and the OpenCV thread count to restore
+_cv2_threads_lock = threading.Lock()
+_cv2_threads_users = 0
+_cv2_threads_saved = None
+
+
+@contextmanager
+def limit_cv2_threads(workers):
+    """Share the cores between our worker threads and OpenCV's internal pool"""
+    global _cv2_threads_users, _cv2_threads_saved
+    if workers <= 1:
+        yield
+        return
+    with _cv2_threads_lock:
+        if _cv2_threads_users == 0:
+            _cv2_threads_saved = cv2.getNumThreads()
+            cv2.setNumThreads(max(1, (os.cpu_count() or 1) // workers))
+        _cv2_threads_users += 1
+    try:
+        yield
+    finally:
+        with _cv2_threads_lock:
+            _cv2_threads_users -= 1
+            if _cv2_threads_users == 0:
+                cv2.setNumThreads(_cv2_threads_saved)
+
+
+def _map(function, items, workers):
+    """map() over items, on a thread pool when more than one worker is requested"""
+    if workers <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(function, items))
+
+
+def _band_rows(shape, band_bytes):
+    """Number of output rows per band that keeps a band within band_bytes"""
+    channels = shape[2] if len(shape) == 3 else 1
+    # Input, a few stage outputs and the int32 edge labels are alive together
+    bytes_per_row = shape[1] * max(channels, 3) * 4
+    return max(1, band_bytes // bytes_per_row)
+
+
+def _bands(height, rows):
+    for start in range(0, height, rows):
+        yield start, min(height, start + rows)
+
+
+def _run_band(image, stages, params, start, stop, halo, pool):
+    """Run stages on rows [start, stop) of image with halo rows of context
+
+    Returns (rows of the result, pool buffer holding them or None); the
+    buffer must be released once the rows have been copied out.
+    """
+    top = max(0, start - halo)
+    bottom = min(image.shape[0], stop + halo)
+    source = np.asarray(image[top:bottom])
+    band = source
+    for stage in stages:
+        result = stage.run(band, params, pool)
+        if band is not source and result is not band:
+            pool.release(band)
+        band = result
+    return band[start - top:stop - top], (band if band is not source else None)
+
+
+def _run_local(image, stages, params, out, rows, workers):
+    """Apply local stages band by band, writing into out"""
+    halo = sum(stage.radius(params) for stage in stages)
+    # Equal-sized bands reuse the same stage buffers
+    pool = BufferPool()
+    
+    def run(bounds):
+        start, stop = bounds
+        band, buffer = _run_band(image, stages, params, start, stop, halo, pool)
+        if band.ndim < out.ndim:
+            band = cv2.cvtColor(band, cv2.COLOR_GRAY2RGB)
+        out[start:stop] = band
+        pool.release(buffer)
+    
+    _map(run, list(_bands(image.shape[0], rows)), workers)
+
+
+def _touching_pairs(upper, lower):
+    """Label pairs that are 8-connected across two consecutive rows"""
+    width = upper.shape[0]
+    pairs = []
+    for shift in (-1, 0, 1):
+        a = upper[max(0, -shift):width - max(0, shift)]
+        b = lower[max(0, shift):width - max(0, -shift)]
+        touching = (a > 0) & (b > 0)
+        pairs.append(np.stack([a[touching], b[touching]], axis=1))
+    return np.concatenate(pairs)
+
+
+def _resolve_components(count, strong, pairs):
+    """Return a lookup telling, per global label, whether it is an edge
+
+    Only labels on a band boundary can be joined, so the union-find runs over
+    those alone; every other label is its own root.
+    """
+    roots = np.arange(count + 1, dtype=np.int64)
+    if pairs:
+        joined = np.unique(np.concatenate(pairs), axis=0)
+        nodes, compact = np.unique(joined, return_inverse=True)
+        parent = list(range(len(nodes)))
+        
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        
+        for a, b in compact.reshape(joined.shape).tolist():
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+        roots[nodes] = nodes[[find(x) for x in range(len(nodes))]]
+    
+    strong_roots = np.zeros(count + 1, dtype=bool)
+    if strong:
+        strong_roots[roots[np.concatenate(strong)]] = True
+    keep = strong_roots[roots]
+    keep[0] = False
+    return keep
+
+
+def _run_edges(image, stages, params, rows, workers, workdir):
+    """Apply local stages followed by Canny; returns a memory-mapped edge map"""
+    height, width = image.shape[:2]
+    halo = sum(stage.radius(params) for stage in stages) + CANNY_RADIUS
+    # OpenCV swaps the thresholds when they are given in the wrong order
+    low, high = sorted((params['canny_low'], params['canny_high']))
+    bands = list(_bands(height, rows))
+    labels = np.lib.format.open_memmap(
+        os.path.join(workdir, 'labels.npy'), mode='w+', dtype=np.int32, shape=(height, width))
+    
+    pool = BufferPool()
+    
+    def label(bounds):
+        # Label candidate components of one band; ids are local to the band
+        start, stop = bounds
+        top = max(0, start - halo)
+        band, buffer = _run_band(image, stages, params, top, min(height, stop + halo), 0, pool)
+        if band.ndim == 3:
+            gray = cv2.cvtColor(band, cv2.COLOR_RGB2GRAY, dst=pool.acquire(band.shape[:2]))
+            pool.release(buffer)
+            buffer = gray
+        else:
+            gray = band
+        canny = pool.acquire(gray.shape)
+        candidates = cv2.Canny(gray, low, low, edges=canny)[start - top:stop - top]
+        found, local = cv2.connectedComponents(candidates, connectivity=8, ltype=cv2.CV_32S)
+        labels[start:stop] = local
+        strong_mask = cv2.Canny(gray, high, high, edges=canny)[start - top:stop - top]
+        strong_labels = np.unique(local[strong_mask > 0])
+        pool.release(buffer, canny)
+        return found - 1, strong_labels, local[0].copy(), local[-1].copy()
+    
+    results = _map(label, bands, workers)
+    
+    # Give every band a disjoint range of global ids, then join across boundaries
+    offsets = np.cumsum([0] + [found for found, _, _, _ in results])
+    strong = []
+    pairs = []
+    for i, (_, band_strong, first_row, last_row) in enumerate(results):
+        band_strong = band_strong[band_strong > 0].astype(np.int64)
+        strong.append(band_strong + offsets[i])
+        if i > 0:
+            previous_row = results[i - 1][3]
+            upper = np.where(previous_row > 0, previous_row + offsets[i - 1], 0)
+            lower = np.where(first_row > 0, first_row + offsets[i], 0)
+            pairs.append(_touching_pairs(upper, lower))
+    keep = _resolve_components(int(offsets[-1]), strong, pairs)
+    
+    edges = np.lib.format.open_memmap(
+        os.path.join(workdir, 'edges.npy'), mode='w+', dtype=np.uint8, shape=(height, width))
+    
+    def write(indexed_bounds):
+        i, (start, stop) = indexed_bounds
+        local = labels[start:stop]
+        edges[start:stop] = keep[np.where(local > 0, local + offsets[i], 0)].astype(np.uint8) * 255
+    
+    _map(write, list(enumerate(bands)), workers)
+    return edges
+
+
+def apply_image_processing_tiled(image, params, out=None, band_bytes=None, workers=1):
+    """Apply image processing band by band with bounded working memory
+
+    image may be a memory-mapped array; out, when given, must have the shape
+    returned by ``output_shape`` and may be memory-mapped as well. With more
+    than one worker, bands are processed concurrently and the working memory
+    is band_bytes per worker. The result is identical to
+    ``apply_image_processing``.
+    """
+    if band_bytes is None:
+        band_bytes = settings.TILE_BAND_BYTES
+    if out is None:
+        out = np.empty(output_shape(image.shape, params), dtype=np.uint8)
+    
+    stages = execution_plan(params, image.ndim)
+    rows = _band_rows(image.shape, band_bytes)
+    names = [stage.name for stage in stages]
+    with limit_cv2_threads(workers):
+        if 'edges' not in names:
+            _run_local(image, stages, params, out, rows, workers)
+            return out
+        
+        split = names.index('edges')
+        with tempfile.TemporaryDirectory(dir=settings.TILE_WORK_DIR) as workdir:
+            edges = _run_edges(image, stages[:split], params, rows, workers, workdir)
+            _run_local(edges, stages[split + 1:], params, out, rows, workers)
+            del edges
+    return out
+
+
+def apply_image_processing_parallel(image, params, workers=None):
+    """Apply image processing in memory on overlapping bands across a thread pool
+
+    The frame is cut into a few bands per worker so that uneven bands do not
+    leave cores idle. With the whole frame in memory Canny does not need the
+    component labelling of the tiled path: it runs once on the full frame
+    between the band-parallel stages, using OpenCV's own thread pool. The
+    result is identical to ``apply_image_processing``.
+    """
+    if workers is None:
+        workers = settings.PARALLEL_WORKERS
+    stages = execution_plan(params, image.ndim)
+    rows = -(-image.shape[0] // (workers * 4))
+    names = [stage.name for stage in stages]
+    split = names.index('edges') if 'edges' in names else len(stages)
+    
+    pre = stages[:split]
+    processed = np.empty(stages_output_shape(image.shape, pre, params), dtype=np.uint8)
+    with limit_cv2_threads(workers):
+        _run_local(image, pre, params, processed, rows, workers)
+    if split == len(stages):
+        return processed
+    
+    processed = stages[split].run(processed, params)
+    out = np.empty(output_shape(image.shape, params), dtype=np.uint8)
+    with limit_cv2_threads(workers):
+        _run_local(processed, stages[split + 1:], params, out, rows, workers)
+    return out
+
+
+def memmap_output(shape):
+    """Uninitialised uint8 array of shape backed by a temporary file in TILE_WORK_DIR
+
+    The file has no name (or is deleted on close) and lives as long as the
+    array, so a large output takes pages the OS can write back to disk instead
+    of process memory.
+    """
+    with tempfile.TemporaryFile(dir=settings.TILE_WORK_DIR) as f:
+        return np.memmap(f, dtype=np.uint8, mode='w+', shape=shape)
+
+
+def process_image_file_tiled(src_path, dst_path, params, band_bytes=None, workers=1):
+    """Stream a ``.npy`` image from disk through the pipeline into dst_path"""
+    image = np.load(src_path, mmap_mode='r')
+    out = np.lib.format.open_memmap(
+        dst_path, mode='w+', dtype=np.uint8, shape=output_shape(image.shape, params))
+    apply_image_processing_tiled(image, params, out=out, band_bytes=band_bytes, workers=workers)
+    out.flush()
+    return out
+
+
+def render_full_resolution(image, params):
+    """Full-resolution pipeline output for export
+
+    Images above PARALLEL_MIN_PIXELS are processed on the thread pool and
+    images above TILED_MIN_PIXELS additionally in bounded-memory bands into a
+    memory-mapped output. Both results are cached under the same key as the
+    staged pipeline, since all paths produce identical output.
+    """
+    pixels = image.shape[0] * image.shape[1]
+    parallel = settings.PARALLEL_WORKERS > 1 and pixels >= settings.PARALLEL_MIN_PIXELS
+    if not execution_plan(params, image.ndim) or not (parallel or pixels >= settings.TILED_MIN_PIXELS):
+        return process_image_cached(image, params)
+    
+    def compute():
+        with measure('render:full', 'render'):
+            if pixels < settings.TILED_MIN_PIXELS:
+                return apply_image_processing_parallel(image, params)
+            return apply_image_processing_tiled(image, params,
+                                                out=memmap_output(output_shape(image.shape, params)),
+                                                workers=settings.PARALLEL_WORKERS)
+    
+    return shared_cache.get_or_compute(pipeline_key(image, params), compute)
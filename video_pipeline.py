@@ -0,0 +1,213 @@
+"""Streaming video processing with the lab's pipeline
+
+Example::
+
+    python video_pipeline.py input.mp4 output.mp4 --params params.json --stats-csv frames.csv
+
+Decoding, processing and encoding run as separate stages connected by
+bounded queues: a decoder thread reads frames, a pool of worker threads runs
+``apply_image_processing`` and ``calculate_image_stats`` on them (OpenCV
+releases the GIL, so the workers use all cores), and the calling thread puts
+the results back into frame order and encodes them. A semaphore caps the
+number of frames alive at any moment, so memory stays fixed whatever the
+length of the video.
+"""
+import argparse
+import csv
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2
+
+from batch_process import STAT_KEYS, load_params
+from buffer_pool import BufferPool
+from image_processing import apply_image_processing
+from image_stats import calculate_image_stats
+from tiled_processing import limit_cv2_threads
+
+FRAME_CSV_COLUMNS = (['Frame']
+                     + [f"Original_{k}" for k in STAT_KEYS]
+                     + [f"Processed_{k}" for k in STAT_KEYS])
+
+_END = object()
+
+
+def _put(frames, item, stop):
+    """Put item on frames; give up, returning False, if stop is set while it is full"""
+    while True:
+        try:
+            frames.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if stop.is_set():
+                return False
+
+
+def _decode(capture, frames, in_flight, stop, workers):
+    """Read frames into the work queue, then send one end marker per worker
+
+    Never blocks for long once stop is set, so that the caller can wait for
+    it before releasing the capture.
+    """
+    index = 0
+    try:
+        while not stop.is_set():
+            ok, frame = capture.read()
+            if not ok:
+                break
+            while not in_flight.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            if not _put(frames, (index, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)), stop):
+                return
+            index += 1
+    finally:
+        for _ in range(workers):
+            if not _put(frames, _END, stop):
+                break
+
+
+def _work(frames, results, params, with_stats, pool):
+    """Process frames until the end marker, forwarding results or the first error"""
+    while True:
+        item = frames.get()
+        if item is _END:
+            results.put(_END)
+            return
+        index, frame = item
+        try:
+            processed = apply_image_processing(frame, params, pool)
+            row = None
+            if with_stats:
+                row = {'Frame': index,
+                       **{f"Original_{k}": v for k, v in calculate_image_stats(frame).as_dict().items()},
+                       **{f"Processed_{k}": v for k, v in calculate_image_stats(processed).as_dict().items()}}
+            results.put((index, processed, row))
+        except Exception as exc:
+            results.put((index, exc, None))
+
+
+def process_video(src_path, dst_path, params, workers=None, max_in_flight=None,
+                  stats_csv=None, fourcc='mp4v', progress=None):
+    """Process every frame of src_path into dst_path; returns (frames, seconds)
+
+    At most max_in_flight frames (default: twice the worker count) are held
+    in memory at once. When stats_csv is given, one row of original and
+    processed statistics per frame is written to it in frame order.
+    progress(frames_written, total_frames) is called after every frame.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    
+    capture = cv2.VideoCapture(src_path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {src_path!r}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    
+    frames = queue.Queue(maxsize=max_in_flight)
+    results = queue.Queue()
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    stop = threading.Event()
+    # Shared by the workers; a processed frame returns to it once encoded, so
+    # at most max_in_flight output buffers exist
+    pool = BufferPool()
+    threads = [threading.Thread(target=_decode, args=(capture, frames, in_flight, stop, workers),
+                                daemon=True)]
+    threads += [threading.Thread(target=_work, args=(frames, results, params, stats_csv is not None, pool),
+                                 daemon=True) for _ in range(workers)]
+    
+    writer = None
+    stats_file = open(stats_csv, 'w', newline='') if stats_csv else None
+    stats_writer = None
+    if stats_file:
+        stats_writer = csv.DictWriter(stats_file, fieldnames=FRAME_CSV_COLUMNS)
+        stats_writer.writeheader()
+    
+    started = time.perf_counter()
+    pending = {}
+    bgr = None
+    next_index = 0
+    finished_workers = 0
+    try:
+        with limit_cv2_threads(workers):
+            for thread in threads:
+                thread.start()
+            while finished_workers < workers:
+                item = results.get()
+                if item is _END:
+                    finished_workers += 1
+                    continue
+                index, processed, row = item
+                if isinstance(processed, Exception):
+                    raise RuntimeError(f"Frame {index} failed") from processed
+                pending[index] = (processed, row)
+                
+                # Encode every frame that is now next in order
+                while next_index in pending:
+                    processed, row = pending.pop(next_index)
+                    if writer is None:
+                        height, width = processed.shape[:2]
+                        writer = cv2.VideoWriter(dst_path, cv2.VideoWriter_fourcc(*fourcc),
+                                                 fps, (width, height))
+                    # One BGR buffer is reused for every frame handed to the encoder
+                    if processed.ndim == 2:
+                        bgr = cv2.cvtColor(processed, cv2.COLOR_GRAY2BGR, dst=bgr)
+                    else:
+                        bgr = cv2.cvtColor(processed, cv2.COLOR_RGB2BGR, dst=bgr)
+                    writer.write(bgr)
+                    pool.release(processed)
+                    if stats_writer:
+                        stats_writer.writerow(row)
+                    next_index += 1
+                    in_flight.release()
+                    if progress:
+                        progress(next_index, total)
+    finally:
+        stop.set()
+        # Unblock workers waiting for frames after an early exit
+        for _ in range(workers):
+            try:
+                frames.put_nowait(_END)
+            except queue.Full:
+                pass
+        # The decoder may be inside capture.read(); it sees stop right after
+        decoder = threads[0]
+        if decoder.is_alive():
+            decoder.join()
+        capture.release()
+        if writer is not None:
+            writer.release()
+        if stats_file:
+            stats_file.close()
+    return next_index, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process a video file with the lab's pipeline")
+    parser.add_argument('input', help="Input video (MP4, AVI, ...)")
+    parser.add_argument('output', help="Output video path")
+    parser.add_argument('--params', help="JSON file with sidebar parameters")
+    parser.add_argument('--stats-csv', help="Write per-frame statistics to this CSV")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Number of processing threads")
+    parser.add_argument('--fourcc', default='mp4v', help="FourCC code of the output codec")
+    args = parser.parse_args(argv)
+    
+    def report(done, total):
+        if done % 100 == 0 or done == total:
+            print(f"{done}/{total or '?'} frames")
+    
+    count, elapsed = process_video(args.input, args.output, load_params(args.params),
+                                   workers=args.workers, stats_csv=args.stats_csv,
+                                   fourcc=args.fourcc, progress=report)
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {count} frames in {elapsed:.1f}s ({rate:.1f} frames/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())